@@ -1,81 +1,153 @@
 import os
-from groq import Groq
-from supabase import create_client, Client
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from clients import get_supabase, get_groq
+from response_cache import get_response_cache
+from image_store import prepare_image, get_image_store
+from metrics import track, start_run, finish_run
+from rate_limit import get_concurrency
+from supabase_reader import iter_rows_sync
 
-# Initialize Supabase client
-supabase: Client = create_client(
-    os.environ.get("SUPABASE_URL", ""),
-    os.environ.get("SUPABASE_SERVICE_KEY", "")
-)
-
-# Initialize Groq client
-groq_client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY", "")
-)
+DESCRIPTION_WORKERS = int(os.getenv("DESCRIPTION_WORKERS", "4"))
+DESCRIPTION_MODEL = "llama-3.2-11b-vision-preview"
+DESCRIPTION_PROMPT = "Describe the person in this image -- their gender, race, facial features, age, etc. No need to describe the image or their clothing, just the person themselves and the vibe they give off. Don't start with 'The person in the image is'. Just directly give the description. Keep it to 1-2 sentences. Example: 'A young woman with long brown hair and blue eyes, wearing a white t-shirt and blue jeans. She has a friendly and approachable smile.'"
 
 def get_image_description(image_url: str) -> str:
     """Get description of an image using Groq's vision model"""
+    # Send a local downscaled copy and key the cache on its content, not the URL
+    image_data_url, image_key = prepare_image(image_url)
+
+    cache = get_response_cache()
+    cache_key = cache.make_key(
+        "groq", DESCRIPTION_MODEL, DESCRIPTION_PROMPT, image_key, temperature=1, max_tokens=1024
+    )
+    hit, cached = cache.get(cache_key)
+    if hit:
+        return cached or ""
+
     try:
-        completion = groq_client.chat.completions.create(
-            model="llama-3.2-11b-vision-preview",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": "Describe the person in this image -- their gender, race, facial features, age, etc. No need to describe the image or their clothing, just the person themselves and the vibe they give off. Don't start with 'The person in the image is'. Just directly give the description. Keep it to 1-2 sentences. Example: 'A young woman with long brown hair and blue eyes, wearing a white t-shirt and blue jeans. She has a friendly and approachable smile.'"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_url
+        with get_concurrency("groq").sync_slot(), track("groq", "chat.completions") as call:
+            completion = get_groq().chat.completions.create(
+                model=DESCRIPTION_MODEL,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text", 
+                                "text": DESCRIPTION_PROMPT
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": image_data_url
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            temperature=1,
-            max_completion_tokens=1024,
-            top_p=1,
-            stream=False,
-            stop=None,
-        )
-        return completion.choices[0].message.content
+                        ]
+                    }
+                ],
+                temperature=1,
+                max_completion_tokens=1024,
+                top_p=1,
+                stream=False,
+                stop=None,
+            )
+            call.usage(completion.usage)
+        description = completion.choices[0].message.content
+        # An empty description is cached as a negative result
+        cache.set(cache_key, description or None)
+        return description
     except Exception as e:
         print(f"Error getting description for {image_url}: {str(e)}")
         return ""
 
-def update_avatar_descriptions():
-    """Fetch avatars without descriptions and update them using Groq vision"""
+def needs_description(row: Dict) -> Optional[str]:
+    """
+    Return the current image hash if the avatar must be (re-)described, or None if
+    its stored description still matches its image. Images are revalidated with
+    their ETag, so unchanged ones are not downloaded again.
+    """
+    stored = get_image_store().get(row['image_url'], revalidate=True)
+    current_hash = stored.content_hash if stored else None
+
+    if not row.get('description'):
+        return current_hash or ""
+    if not row.get('image_hash'):
+        # Described before hashes were tracked: record the hash, keep the description
+        if current_hash:
+            with track("supabase", "update:avatars"):
+                get_supabase().table('avatars').update({
+                    'image_hash': current_hash
+                }).eq('avatar_id', row['avatar_id']).execute()
+        return None
+    if current_hash and current_hash != row['image_hash']:
+        return current_hash
+    return None
+
+def describe_avatar(row: Dict, incremental: bool = True) -> bool:
+    """Describe one avatar if needed and store the result. Returns True if updated."""
+    if incremental:
+        image_hash = needs_description(row)
+        if image_hash is None:
+            return False
+    else:
+        stored = get_image_store().get(row['image_url'])
+        image_hash = stored.content_hash if stored else ""
+
+    print(f"Processing avatar {row['avatar_id']} with image URL: {row['image_url']}")
+
+    # Get description from Groq
+    description = get_image_description(row['image_url'])
+
+    if not description:
+        print(f"No description generated for avatar {row['avatar_id']}")
+        return False
+
+    # Update the description in the database
+    update = {'description': description}
+    if image_hash:
+        update['image_hash'] = image_hash
+    with track("supabase", "update:avatars"):
+        get_supabase().table('avatars').update(update).eq('avatar_id', row['avatar_id']).execute()
+
+    print(f"Updated description for avatar {row['avatar_id']}")
+    print(f"Description: {description}")
+    return True
+
+def update_avatar_descriptions(incremental: bool = True, workers: int = DESCRIPTION_WORKERS):
+    """
+    Describe avatars using Groq vision. In incremental mode only avatars with no
+    description or whose image changed since it was described are sent to the model.
+    """
     try:
-        # Fetch rows where description is null or empty
-        response = supabase.table('avatars').select('avatar_id, image_url').execute()
-        
-        for row in response.data:
-            if row['image_url']:
-                print(f"Processing avatar {row['avatar_id']} with image URL: {row['image_url']}")
-                
-                # Get description from Groq
-                description = get_image_description(row['image_url'])
-                
-                if description:
-                    # Update the description in the database
-                    supabase.table('avatars').update({
-                        'description': description
-                    }).eq('avatar_id', row['avatar_id']).execute()
-                    
-                    print(f"Updated description for avatar {row['avatar_id']}")
-                    print(f"Description: {description}")
-                else:
-                    print("No description generated")
-            else:
-                print("No image URL found for the first row")
-        else:
-            print("No avatars found in the database")
+        rows = [
+            row for row in iter_rows_sync(
+                get_supabase(), 'avatars', 'avatar_id, image_url, description, image_hash', key='avatar_id'
+            )
+            if row['image_url']
+        ]
+        if not rows:
+            print("No avatars with image URLs found in the database")
+            return
+
+        def process(row: Dict) -> bool:
+            try:
+                return describe_avatar(row, incremental)
+            except Exception as e:
+                print(f"Error describing avatar {row['avatar_id']}: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            updated = sum(executor.map(process, rows))
+
+        print(f"Updated {updated} of {len(rows)} avatar descriptions")
             
     except Exception as e:
         print(f"Error updating avatar descriptions: {str(e)}")
 
 if __name__ == "__main__":
-    update_avatar_descriptions()
+    start_run()
+    try:
+        update_avatar_descriptions()
+    finally:
+        finish_run()
@@ -0,0 +1,125 @@
+import os
+import re
+import hashlib
+from typing import TYPE_CHECKING, Dict, List, Optional
+import numpy as np
+from metrics import track
+from rate_limit import get_concurrency
+from vector_store import VectorStore
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BATCH_SIZE = 256
+INDEX_PATH = os.getenv(
+    "AVATAR_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "avatar_vectors")
+)
+
+def description_hash(description: str) -> str:
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()[:16]
+
+def infer_gender(description: str) -> Optional[str]:
+    """Best-effort gender from a free-text description, matching HeyGen's values."""
+    words = set(re.findall(r"[a-z]+", description.lower()))
+    female = words & {"woman", "women", "female", "girl", "she", "her", "lady"}
+    male = words & {"man", "men", "male", "boy", "he", "his", "guy"}
+    if female and not male:
+        return "female"
+    if male and not female:
+        return "male"
+    return None
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+async def embed_texts(client: "AsyncOpenAI", texts: List[str]) -> np.ndarray:
+    """Embed texts in batches and return an (n, dim) float32 matrix of unit vectors."""
+    chunks = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        async with get_concurrency("openai").slot():
+            with track("openai", "embeddings") as call:
+                response = await client.embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    input=texts[start:start + EMBEDDING_BATCH_SIZE]
+                )
+                call.usage(response.usage)
+        chunks.append(np.array([item.embedding for item in response.data], dtype=np.float32))
+    return _normalize(np.vstack(chunks))
+
+class AvatarIndex:
+    """Unit-normalized avatar description embeddings searched by cosine similarity."""
+
+    def __init__(
+        self,
+        avatar_ids: List[str],
+        genders: List[Optional[str]],
+        hashes: List[str],
+        vectors: np.ndarray,
+        model: str = EMBEDDING_MODEL
+    ):
+        self.model = model
+        self.avatar_ids = np.array(avatar_ids, dtype=object)
+        self.genders = np.array([g or "" for g in genders], dtype=object)
+        self.hashes = list(hashes)
+        self.vectors = vectors.astype(np.float32, copy=False)
+
+    def __len__(self) -> int:
+        return len(self.avatar_ids)
+
+    def search(self, query: np.ndarray, k: int = 10, gender: Optional[str] = None) -> List[Dict]:
+        """
+        Return the top-k avatars as [{'avatar_id', 'score'}], best first. With `gender`,
+        only avatars of that gender are considered (falls back to all if none match).
+        """
+        if not len(self):
+            return []
+        query = query.astype(np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.vectors @ query
+
+        candidates = np.arange(len(scores))
+        if gender:
+            same_gender = np.flatnonzero(self.genders == gender)
+            if len(same_gender):
+                candidates = same_gender
+
+        k = min(k, len(candidates))
+        if k <= 0:
+            return []
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [{"avatar_id": self.avatar_ids[i], "score": float(scores[i])} for i in top]
+
+async def build_avatar_index(client: "AsyncOpenAI", avatars: List[Dict], path: str = INDEX_PATH) -> AvatarIndex:
+    """
+    Build the index for the given avatars. Embeddings are kept in the vector
+    store at `path`, so only descriptions that are new or changed since the
+    last build are embedded.
+    """
+    avatars = [a for a in avatars if a.get("description")]
+    hashes = [description_hash(a["description"]) for a in avatars]
+    ids = [a["avatar_id"] for a in avatars]
+
+    store = VectorStore(path, metadata={"model": EMBEDDING_MODEL})
+    if store.metadata.get("model") != EMBEDDING_MODEL:
+        store.clear({"model": EMBEDDING_MODEL})
+
+    missing = [i for i, avatar_id in enumerate(ids) if store.tag(avatar_id) != hashes[i]]
+    if missing:
+        fresh = await embed_texts(client, [avatars[i]["description"] for i in missing])
+        store.add([ids[i] for i in missing], fresh, [hashes[i] for i in missing])
+    current = set(ids)
+    store.delete([avatar_id for avatar_id in store.keys() if avatar_id not in current])
+
+    if ids:
+        vectors = np.vstack([store.get(avatar_id) for avatar_id in ids])
+    else:
+        # Keep the shape a query can multiply against even with nothing indexed yet
+        vectors = np.zeros((0, store.dim or 0), dtype=np.float32)
+    index = AvatarIndex(ids, [a.get("gender") for a in avatars], hashes, vectors)
+    print(f"Avatar index ready: {len(index)} avatars ({len(missing)} newly embedded)")
+    return index
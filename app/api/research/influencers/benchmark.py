@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+from mock_providers import MockProviders, ProviderProfile, DEFAULT_PROFILES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(HERE, "..", "..", "..", ".."))
+
+# Standalone scripts in the order the pipeline needs them
+SCRIPT_STEPS = [
+    ("fetch_avatars", [os.path.join(HERE, "fetch_avatars.py")]),
+    ("avatar_descriptions", [os.path.join(HERE, "avatar_descriptions.py")]),
+    ("influencer_images", [os.path.join(HERE, "influencer_images.py")]),
+    ("influencer_research", [os.path.join(HERE, "influencer_research.py")]),
+    ("influencer_to_avatar", [os.path.join(HERE, "influencer_to_avatar.py")]),
+]
+PIPELINE_STEP = ("pipeline", [os.path.join(REPO_ROOT, "main.py")])
+
+def run_step(name: str, command: List[str], env: Dict[str, str], workdir: str) -> Dict:
+    """Run one script against the mocks; returns wall time, peak RSS and its metrics."""
+    summary_path = os.path.join(workdir, f"{name}.metrics.json")
+    env = {**env, "METRICS_SUMMARY_PATH": summary_path}
+    log_path = os.path.join(workdir, f"{name}.log")
+
+    started = time.perf_counter()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen([sys.executable, *command], cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    returncode = os.waitstatus_to_exitcode(status)
+
+    metrics = {}
+    if os.path.exists(summary_path):
+        with open(summary_path) as f:
+            metrics = json.load(f)
+    if returncode != 0:
+        print(f"[{name}] exited with {returncode}, see {log_path}")
+
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        "seconds": elapsed,
+        "returncode": returncode,
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "calls": metrics.get("calls", {}),
+    }
+
+# Modules whose cold import time is reported by --imports
+IMPORT_MODULES = [
+    "get_influencers",
+    "fetch_avatars",
+    "avatar_descriptions",
+    "influencer_images",
+    "influencer_research",
+    "influencer_to_avatar",
+    "product_to_influencer",
+    "pipeline",
+]
+
+def measure_import_time(module: str, top: int = 5) -> Dict:
+    """
+    Import `module` in a fresh interpreter under `-X importtime` and return its
+    cumulative import time plus the heaviest top-level imports it pulled in.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE,
+        capture_output=True,
+        text=True
+    )
+    total = None
+    children = []
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown as two spaces of indentation per level; a parent is
+        # printed after its children
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                total = int(cumulative)
+                break
+            children = []
+        elif depth == 1:
+            children.append((name.strip(), int(cumulative)))
+    heaviest = sorted(children, key=lambda t: t[1], reverse=True)[:top]
+    return {
+        "ok": result.returncode == 0,
+        "error": result.stderr.strip().splitlines()[-1] if result.returncode else None,
+        "seconds": total / 1e6 if total is not None else None,
+        "heaviest": [{"module": name, "seconds": us / 1e6} for name, us in heaviest],
+    }
+
+def print_import_report(report: Dict, baseline: Optional[Dict] = None) -> None:
+    for module, timing in report.items():
+        if not timing["ok"]:
+            print(f"{module:22} failed: {timing['error']}")
+            continue
+        line = f"{module:22} {timing['seconds'] * 1000:8.1f} ms"
+        before = (baseline or {}).get(module, {}).get("seconds")
+        if before:
+            line += f"  ({(timing['seconds'] - before) / before * 100:+.1f}% vs baseline)"
+        print(line)
+        for entry in timing["heaviest"]:
+            print(f"    {entry['module']:36} {entry['seconds'] * 1000:8.1f} ms")
+
+def _stage_timings(calls: Dict[str, Dict]) -> Dict:
+    # Pipeline stages record each item's handler time as "stage:<name>"
+    return {
+        key.split(":", 1)[1]: {
+            "items": stats["calls"],
+            "errors": stats["errors"],
+            "busy_seconds": round((stats["latency_avg"] or 0) * stats["calls"], 3),
+            "p50": stats["latency_p50"],
+            "p95": stats["latency_p95"],
+            "p99": stats["latency_p99"],
+        }
+        for key, stats in calls.items()
+        if key.startswith("stage:")
+    }
+
+def summarize(steps: Dict[str, Dict], influencers: int) -> Dict:
+    totals = {}
+    for name, step in steps.items():
+        totals[name] = {
+            "seconds": round(step["seconds"], 3),
+            "influencers_per_second": round(influencers / step["seconds"], 3) if step["seconds"] else None,
+            "peak_rss_mb": round(step["peak_rss_mb"], 1),
+            "returncode": step["returncode"],
+            "stages": _stage_timings(step["calls"]),
+            "calls": {
+                key: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "retries": stats["retries"],
+                    "p50": stats["latency_p50"],
+                    "p95": stats["latency_p95"],
+                    "p99": stats["latency_p99"],
+                }
+                for key, stats in step["calls"].items()
+                if not key.startswith("stage:")
+            },
+        }
+    return totals
+
+def print_report(report: Dict, baseline: Optional[Dict] = None) -> None:
+    def fmt(value):
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    for name, step in report["steps"].items():
+        line = f"{name:22} {step['seconds']:8.2f}s  {step['influencers_per_second'] or 0:8.2f} inf/s  {step['peak_rss_mb']:7.1f} MB"
+        if baseline and name in baseline.get("steps", {}):
+            before = baseline["steps"][name]["seconds"]
+            if before:
+                line += f"  ({(step['seconds'] - before) / before * 100:+.1f}% vs baseline)"
+        print(line)
+        for stage, stats in step.get("stages", {}).items():
+            print(f"    stage {stage:34} n={stats['items']:<5} err={stats['errors']:<3} busy={stats['busy_seconds']:.1f}s "
+                  f"p50={fmt(stats['p50'])} p95={fmt(stats['p95'])} p99={fmt(stats['p99'])}")
+        for key, stats in step["calls"].items():
+            print(f"    {key:40} n={stats['calls']:<5} err={stats['errors']:<3} retry={stats['retries']:<3} "
+                  f"p50={fmt(stats['p50'])} p95={fmt(stats['p95'])} p99={fmt(stats['p99'])}")
+
+def parse_profiles(values: List[str]) -> Dict[str, ProviderProfile]:
+    """Parse `provider:median_ms:error_rate[:payload_bytes]` overrides."""
+    profiles = {}
+    for value in values:
+        parts = value.split(":")
+        base = DEFAULT_PROFILES.get(parts[0], ProviderProfile())
+        profiles[parts[0]] = ProviderProfile(
+            median_ms=float(parts[1]) if len(parts) > 1 else base.median_ms,
+            sigma=base.sigma,
+            error_rate=float(parts[2]) if len(parts) > 2 else base.error_rate,
+            payload_bytes=int(parts[3]) if len(parts) > 3 else base.payload_bytes,
+        )
+    return profiles
+
+def run_benchmark(
+    influencers: int,
+    avatars: int,
+    profiles: Dict[str, ProviderProfile],
+    steps: List[str],
+    keep: bool = False
+) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="influencer-bench-")
+    results: Dict[str, Dict] = {}
+    mocks = None
+    try:
+        for name, command in SCRIPT_STEPS + [PIPELINE_STEP]:
+            if name not in steps:
+                continue
+            # Scripts build on each other; the full pipeline starts from a clean slate
+            if mocks is None or name == "pipeline":
+                if mocks is not None:
+                    mocks.stop()
+                mocks = MockProviders(profiles).start()
+                mocks.seed(influencers, avatars)
+                cache_dir = os.path.join(workdir, name if name == "pipeline" else "scripts")
+                os.makedirs(cache_dir, exist_ok=True)
+                env = {
+                    **os.environ,
+                    **mocks.env(),
+                    "PYTHONUNBUFFERED": "1",
+                    "RESPONSE_CACHE_BYPASS": "1",
+                    "RESPONSE_CACHE_PATH": os.path.join(cache_dir, "responses.sqlite3"),
+                    "WORK_JOURNAL_PATH": os.path.join(cache_dir, "journal.sqlite3"),
+                    "IMAGE_CACHE_DIR": os.path.join(cache_dir, "images"),
+                    "AVATAR_INDEX_PATH": os.path.join(cache_dir, "avatar_vectors"),
+                    "INFLUENCER_INDEX_PATH": os.path.join(cache_dir, "influencer_vectors"),
+                    "BRAVE_RPM": "100000",
+                    "PERPLEXITY_RPM": "100000",
+                }
+            print(f"Running {name}...")
+            results[name] = run_step(name, command, env, workdir)
+    finally:
+        if mocks is not None:
+            mocks.stop()
+        if keep:
+            print(f"Logs and metrics kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "influencers": influencers,
+        "avatars": avatars,
+        "profiles": {name: vars(profile) for name, profile in {**DEFAULT_PROFILES, **profiles}.items()},
+        "steps": summarize(results, influencers),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the influencer scripts against local mock providers and report throughput and latency."
+    )
+    parser.add_argument("--influencers", type=int, default=100)
+    parser.add_argument("--avatars", type=int, default=40)
+    parser.add_argument("--provider", action="append", default=[], metavar="NAME:MEDIAN_MS:ERROR_RATE[:BYTES]",
+                        help="override a mock provider profile, e.g. perplexity:1500:0.05")
+    parser.add_argument("--steps", default=",".join(name for name, _ in SCRIPT_STEPS + [PIPELINE_STEP]),
+                        help="comma separated steps to run")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    parser.add_argument("--keep", action="store_true", help="keep logs and per-step metrics")
+    parser.add_argument("--imports", action="store_true",
+                        help="report the cold import time of each script instead of running them")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.imports:
+        imports = {module: measure_import_time(module) for module in IMPORT_MODULES}
+        print_import_report(imports, (baseline or {}).get("imports"))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"imports": imports}, f, indent=2)
+            print(f"Report written to {args.output}")
+        return
+
+    report = run_benchmark(
+        args.influencers,
+        args.avatars,
+        parse_profiles(args.provider),
+        [step.strip() for step in args.steps.split(",") if step.strip()],
+        keep=args.keep
+    )
+
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import os
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from metrics import track
+from work_journal import WorkJournal
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+CITATION_BATCH_SIZE = int(os.getenv("CITATION_BATCH_SIZE", "200"))  # URLs per request
+CITATION_FLUSH_INTERVAL = float(os.getenv("CITATION_FLUSH_INTERVAL", "10"))
+CITATION_ID_CACHE_SIZE = int(os.getenv("CITATION_ID_CACHE_SIZE", "50000"))
+CITATION_LOOKUP_CHUNK = 50  # Hashes per select; 64 characters each go into the GET query string
+
+# Query parameters that only say where a click came from, never what was linked
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "igshid", "igsh",
+    "mc_cid", "mc_eid", "_hsenc", "_hsmi", "ref", "ref_src", "ref_url", "si", "spm",
+    "_t", "_r", "is_from_webapp", "sender_device", "sender_web_id", "share_app_id", "is_copy_url",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+
+def canonicalize_url(url: str) -> Optional[str]:
+    """
+    Reduce a citation URL to one spelling per source: https, lowercase host
+    without "www." or a default port, no fragment, no trailing slash, and the
+    query without tracking parameters, sorted. Returns None for anything that
+    isn't an http(s) URL.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except (AttributeError, ValueError):
+        return None
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    netloc = host if port in (None, 80, 443) else f"{host}:{port}"
+    path = parts.path.rstrip("/") or "/"
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+    return urlunsplit(("https", netloc, path, urlencode(query), ""))
+
+def url_hash(canonical_url: str) -> str:
+    return hashlib.sha256(canonical_url.encode("utf-8")).hexdigest()
+
+def canonical_citations(urls: Iterable[str]) -> Dict[str, str]:
+    """Canonical form of each usable URL, keyed by its hash; duplicates collapse."""
+    citations = {}
+    for url in urls:
+        if isinstance(url, str):
+            canonical = canonicalize_url(url)
+            if canonical:
+                citations[url_hash(canonical)] = canonical
+    return citations
+
+class CitationWriter:
+    """
+    Buffers the citations of researched influencers and writes them in bulk:
+    each canonical URL is stored once in `citations` (insert-or-get by its
+    hash) and linked to the influencers citing it in `influencer_citations`.
+    A flush happens once `batch_size` URLs are buffered, every `flush_interval`
+    seconds and on exit. Citation ids seen before are remembered, so popular
+    sources cost no lookups. With a `journal`, pending citations are recorded
+    under `journal_stage` and can be replayed with `replay_journal`.
+
+        async with CitationWriter(supabase) as citations:
+            await citations.add(influencer_id, research["citations"])
+    """
+
+    def __init__(
+        self,
+        client: "Client",
+        batch_size: int = CITATION_BATCH_SIZE,
+        flush_interval: float = CITATION_FLUSH_INTERVAL,
+        journal: Optional[WorkJournal] = None,
+        journal_stage: str = "citations",
+        id_cache_size: int = CITATION_ID_CACHE_SIZE
+    ):
+        self.client = client
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.journal = journal
+        self.journal_stage = journal_stage
+        self.id_cache_size = id_cache_size
+        self.linked = 0
+        self._ids: "OrderedDict[str, str]" = OrderedDict()
+        self._buffer: Dict[str, Set[str]] = {}
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "CitationWriter":
+        if self.flush_interval > 0:
+            self._timer = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def add(self, influencer_id: str, urls: Iterable[str]) -> None:
+        """Buffer the citations of one influencer; they are added to any it already has."""
+        pending = self._buffer.setdefault(str(influencer_id), set())
+        pending.update(url for url in urls if isinstance(url, str))
+        if self.journal is not None:
+            self.journal.complete(self.journal_stage, str(influencer_id), sorted(pending))
+        if sum(len(urls) for urls in self._buffer.values()) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Store and link everything buffered; on failure it stays buffered for the next flush."""
+        async with self._lock:
+            buffered = self._buffer
+            self._buffer = {}
+            if not buffered:
+                return
+            try:
+                await asyncio.to_thread(self._write, buffered)
+                if self.journal is not None:
+                    self.journal.mark_written(self.journal_stage, list(buffered))
+            except Exception as e:
+                print(f"Error writing citations for {len(buffered)} influencers: {str(e)}")
+                for influencer_id, urls in buffered.items():
+                    self._buffer.setdefault(influencer_id, set()).update(urls)
+
+    async def replay_journal(self) -> int:
+        """Re-buffer journaled citations that were never written; returns for how many influencers."""
+        if self.journal is None:
+            return 0
+        pending = self.journal.unwritten(self.journal_stage)
+        for influencer_id, urls in pending:
+            self._buffer.setdefault(influencer_id, set()).update(urls)
+        if pending:
+            print(f"Replaying unwritten citations of {len(pending)} influencers")
+            await self.flush()
+        return len(pending)
+
+    def _write(self, buffered: Dict[str, Set[str]]) -> None:
+        canonical = {influencer_id: canonical_citations(urls) for influencer_id, urls in buffered.items()}
+        ids = self.resolve({h: url for citations in canonical.values() for h, url in citations.items()})
+        links = [
+            {"influencer_id": influencer_id, "citation_id": ids[h]}
+            for influencer_id, citations in canonical.items()
+            for h in citations
+            if h in ids
+        ]
+        for start in range(0, len(links), self.batch_size):
+            chunk = links[start:start + self.batch_size]
+            with track("supabase", "upsert:influencer_citations"):
+                self.client.table("influencer_citations").upsert(
+                    chunk,
+                    on_conflict="influencer_id,citation_id",
+                    ignore_duplicates=True
+                ).execute()
+            self.linked += len(chunk)
+
+    def resolve(self, citations: Dict[str, str]) -> Dict[str, str]:
+        """
+        Citation id for each {url hash: canonical url}, inserting the ones that
+        are new. Ids already known come from memory; the rest take one insert
+        per chunk plus small selects for the hashes another writer stored first.
+        """
+        ids = {h: self._ids[h] for h in citations if h in self._ids}
+        missing = [h for h in citations if h not in ids]
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            rows = [
+                {"url": citations[h], "url_hash": h, "domain": urlsplit(citations[h]).hostname}
+                for h in chunk
+            ]
+            with track("supabase", "upsert:citations"):
+                # Existing hashes are skipped and not returned
+                inserted = self.client.table("citations").upsert(
+                    rows,
+                    on_conflict="url_hash",
+                    ignore_duplicates=True
+                ).execute().data or []
+            found = {row["url_hash"]: row["id"] for row in inserted}
+            existing = [h for h in chunk if h not in found]
+            for lookup in range(0, len(existing), CITATION_LOOKUP_CHUNK):
+                hashes = existing[lookup:lookup + CITATION_LOOKUP_CHUNK]
+                with track("supabase", "select:citations"):
+                    rows = self.client.table("citations").select("id, url_hash").in_("url_hash", hashes).execute().data
+                found.update({row["url_hash"]: row["id"] for row in rows})
+            ids.update(found)
+
+        for h, citation_id in ids.items():
+            self._ids[h] = citation_id
+            self._ids.move_to_end(h)
+        while len(self._ids) > self.id_cache_size:
+            self._ids.popitem(last=False)
+        return ids
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._buffer:
+                await self.flush()
+
+    async def close(self) -> None:
+        """Stop the flush timer and write whatever is still buffered."""
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        await self.flush()
+        if self._buffer:
+            print(f"Failed to write citations for {len(self._buffer)} influencers")
+
+def influencer_citations(client: "Client", influencer_id: str) -> List[str]:
+    """Canonical URLs of every source cited in an influencer's research."""
+    with track("supabase", "select:influencer_citations"):
+        rows = client.table("influencer_citations").select(
+            "citation:citations(url)"
+        ).eq("influencer_id", influencer_id).execute().data
+    return sorted(row["citation"]["url"] for row in rows if row.get("citation"))
+
+async def move_embedded_citations() -> int:
+    """
+    Move the `citations` lists still embedded in influencer_research into the
+    citation tables and drop them from the jsonb. Returns how many influencers
+    were moved. Safe to re-run; citations are journaled before the jsonb changes.
+    """
+    from clients import get_supabase
+    from supabase_reader import iter_rows
+    from supabase_writer import BulkUpsertWriter
+    from work_journal import get_work_journal
+
+    supabase = get_supabase()
+    journal = get_work_journal()
+    moved = 0
+    async with CitationWriter(supabase, journal=journal) as citations:
+        await citations.replay_journal()
+        async with BulkUpsertWriter(supabase, "influencers", on_conflict="id") as writer:
+            async for row in iter_rows(
+                supabase,
+                "influencers",
+                "id, name, influencer_research",
+                where=lambda query: query.not_.is_("influencer_research->citations", "null")
+            ):
+                research = dict(row["influencer_research"])
+                await citations.add(row["id"], research.pop("citations", None) or [])
+                await writer.add({"id": row["id"], "name": row["name"], "influencer_research": research})
+                moved += 1
+    return moved
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from http_pool import close_async_clients
+    from metrics import start_run, finish_run
+
+    load_dotenv('.env.local')
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Move citations embedded in influencer_research into the citations tables."
+    )
+    parser.parse_args()
+
+    async def main():
+        start_run()
+        try:
+            print(f"Moved the citations of {await move_embedded_citations()} influencers")
+        finally:
+            await close_async_clients()
+            finish_run()
+
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Tuple
+
+if TYPE_CHECKING:
+    from groq import Groq
+    from openai import AsyncOpenAI
+    from supabase import Client
+
+# Name -> (pid, client); a forked worker builds its own once and then reuses it
+_clients: Dict[str, Tuple[int, Any]] = {}
+_lock = threading.Lock()
+
+def _shared(name: str, factory: Callable[[], Any]) -> Any:
+    pid = os.getpid()
+    entry = _clients.get(name)
+    if entry is not None and entry[0] == pid:
+        return entry[1]
+    with _lock:
+        entry = _clients.get(name)
+        if entry is None or entry[0] != pid:
+            entry = (pid, factory())
+            _clients[name] = entry
+        return entry[1]
+
+def get_supabase() -> "Client":
+    """
+    Process-wide Supabase client, created on first use. Accepts both the
+    SUPABASE_URL / SUPABASE_SERVICE_KEY and the NEXT_PUBLIC_SUPABASE_URL /
+    SUPABASE_SERVICE_ROLE_KEY naming used by the scripts.
+    """
+    def create():
+        from supabase import create_client
+        return create_client(
+            os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL", ""),
+            os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+        )
+    return _shared("supabase", create)
+
+def get_openai() -> "AsyncOpenAI":
+    """Process-wide async OpenAI client, created on first use."""
+    def create():
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _shared("openai", create)
+
+def get_groq() -> "Groq":
+    """Process-wide Groq client, created on first use."""
+    def create():
+        from groq import Groq
+        return Groq(api_key=os.environ.get("GROQ_API_KEY", ""))
+    return _shared("groq", create)
+
+def supabase_configured() -> bool:
+    return bool(
+        (os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL"))
+        and (os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+    )
@@ -1,16 +1,14 @@
 import requests
 from typing import List, Dict
-from supabase import create_client
 import os
 from dotenv import load_dotenv
+from metrics import track, start_run, finish_run
+from clients import get_supabase
 
 # Load environment variables
 load_dotenv('.env.local')
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(supabase_url, supabase_key)
+HEYGEN_AVATARS_URL = os.getenv("HEYGEN_AVATARS_URL", "https://api.heygen.com/v2/avatars")
 
 def get_heygen_avatars() -> List[Dict[str, str]]:
     """
@@ -20,7 +18,7 @@ def get_heygen_avatars() -> List[Dict[str, str]]:
     Returns:
         List of dicts containing avatar_id, name (first word only), gender, and image_url
     """
-    url = "https://api.heygen.com/v2/avatars"
+    url = HEYGEN_AVATARS_URL
     
     # Add HeyGen API key to headers
     headers = {
@@ -28,7 +26,10 @@ def get_heygen_avatars() -> List[Dict[str, str]]:
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        with track("heygen", "v2/avatars") as call:
+            response = requests.get(url, headers=headers)
+            call.status_code = response.status_code
+            call.bytes_received = len(response.content)
         response.raise_for_status()
         
         data = response.json()
@@ -68,17 +69,18 @@ def update_supabase_avatars(avatars: List[Dict[str, str]]) -> None:
     """
     try:
         # Specify the columns explicitly
-        result = supabase.table('avatars').upsert(
-            [
-                {
-                    'avatar_id': avatar['avatar_id'],
-                    'name': avatar['name'],
-                    'gender': avatar['gender'],
-                    'image_url': avatar['image_url']
-                }
-                for avatar in avatars
-            ]
-        ).execute()
+        with track("supabase", "upsert:avatars"):
+            result = get_supabase().table('avatars').upsert(
+                [
+                    {
+                        'avatar_id': avatar['avatar_id'],
+                        'name': avatar['name'],
+                        'gender': avatar['gender'],
+                        'image_url': avatar['image_url']
+                    }
+                    for avatar in avatars
+                ]
+            ).execute()
         
         print(f"Successfully updated {len(avatars)} avatars in Supabase")
         return result
@@ -88,6 +90,7 @@ def update_supabase_avatars(avatars: List[Dict[str, str]]) -> None:
         return None
 
 if __name__ == "__main__":
+    start_run()
     # Test the functions
     avatars = get_heygen_avatars()
     for avatar in avatars:
@@ -96,3 +99,4 @@ if __name__ == "__main__":
     # Update Supabase with the fetched avatars
     if avatars:
         update_supabase_avatars(avatars)
+    finish_run()
@@ -1,13 +1,17 @@
 import csv
-import uuid
-from supabase import create_client, Client
+import re
+import sys
+import json
+from typing import Dict, Iterable, Iterator, List, Optional
+from clients import get_supabase
+from metrics import track
 import os
 
-# Initialize Supabase client
-supabase: Client = create_client(
-    os.environ.get("NEXT_PUBLIC_SUPABASE_URL"),
-    os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-)
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "500"))  # Rows per upsert request
+
+# TikTok usernames: letters, digits, underscores and periods. New ones are capped
+# at 24 characters but older accounts can be longer.
+HANDLE_PATTERN = re.compile(r"^[a-z0-9._]{1,32}$")
 
 # Input text
 input_text = """
@@ -587,26 +591,193 @@ The Sorry Girls (@thesorrygirls)
 Rachel Metz (@rachelmetz)
 """
 
-# Split lines and process data
-lines = input_text.split('\n')
-influencers = []
-
-for line in lines:
-    if "@" in line:  # Only process lines containing an @
-        name, account = line.rsplit("(@", 1)
-        account = account.strip(")")  # Remove closing bracket
-        
-        # Create influencer record
-        influencer = {
-            "id": str(uuid.uuid4()),
-            "name": name.strip(),
-            "tiktok_profile_link": f"https://www.tiktok.com/@{account.strip()}"
-        }
-        influencers.append(influencer)
-
-# Insert data into Supabase
-try:
-    response = supabase.table('influencers').insert(influencers).execute()
-    print(f"Successfully added {len(influencers)} influencers to the database")
-except Exception as e:
-    print(f"Error inserting data into Supabase: {str(e)}")
\ No newline at end of file
+def normalize_handle(value: str) -> Optional[str]:
+    """
+    Reduce "@Handle", "handle" or a TikTok profile URL to the lower-case handle,
+    or None if it isn't a valid TikTok username.
+    """
+    handle = value.strip()
+    if "tiktok.com/" in handle:
+        handle = handle.split("?", 1)[0].split("#", 1)[0].rstrip("/")
+        handle = handle.rsplit("/@", 1)[-1] if "/@" in handle else handle.rsplit("/", 1)[-1]
+    handle = handle.lstrip("@").strip().lower()
+    return handle if HANDLE_PATTERN.match(handle) else None
+
+def make_influencer(name: str, handle: str, category: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """Build an influencer record keyed on its normalized handle."""
+    handle = normalize_handle(handle)
+    if not handle:
+        return None
+    return {
+        "name": name.strip(),
+        "tiktok_handle": handle,
+        "tiktok_profile_link": f"https://www.tiktok.com/@{handle}",
+        "category": category
+    }
+
+def iter_text_records(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """
+    Parse "Name (@handle)" lines into influencer records. Lines without a handle
+    are category headers and apply to the lines below them.
+    """
+    category = None
+    for line in lines:
+        line = line.strip()
+        if "(@" in line:
+            name, account = line.rsplit("(@", 1)
+            influencer = make_influencer(name, account.strip(")"), category)
+            if influencer:
+                yield influencer
+            else:
+                print(f"Skipping invalid handle: {line}")
+        elif line:
+            category = line
+
+def iter_csv_records(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """
+    Read influencer records from CSV with a header row: `name` plus one of
+    `tiktok_handle`, `handle` or `tiktok_profile_link`, and optionally `category`.
+    """
+    for row in csv.DictReader(lines):
+        handle = row.get("tiktok_handle") or row.get("handle") or row.get("tiktok_profile_link") or ""
+        influencer = make_influencer(row.get("name") or "", handle, row.get("category") or None)
+        if influencer and influencer["name"]:
+            yield influencer
+        else:
+            print(f"Skipping invalid row: {row}")
+
+def iter_jsonl_records(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """Read influencer records from JSON lines with the same keys as the CSV format."""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            print(f"Skipping invalid JSON line: {line.strip()}")
+            continue
+        if not isinstance(row, dict):
+            print(f"Skipping JSON line that is not an object: {line.strip()}")
+            continue
+        handle = row.get("tiktok_handle") or row.get("handle") or row.get("tiktok_profile_link") or ""
+        influencer = make_influencer(row.get("name") or "", handle, row.get("category"))
+        if influencer and influencer["name"]:
+            yield influencer
+        else:
+            print(f"Skipping invalid row: {row}")
+
+READERS = {
+    "text": iter_text_records,
+    "csv": iter_csv_records,
+    "jsonl": iter_jsonl_records,
+}
+
+def read_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """
+    Stream influencer records from a file, or stdin for "-". The format is taken
+    from the extension (.csv, .jsonl/.ndjson, anything else is text) unless given.
+    """
+    if fmt is None:
+        extension = os.path.splitext(path)[1].lower()
+        fmt = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}.get(extension, "text")
+    reader = READERS[fmt]
+    if path == "-":
+        yield from reader(sys.stdin)
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from reader(f)
+
+def parse_influencers(text: str) -> List[Dict[str, str]]:
+    """Parse the inline "Name (@handle)" roster into influencer records."""
+    return list(iter_text_records(text.split('\n')))
+
+def dedupe_influencers(influencers: Iterable[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Keep the first record per handle."""
+    seen = {}
+    total = 0
+    for influencer in influencers:
+        total += 1
+        seen.setdefault(influencer["tiktok_handle"], influencer)
+    duplicates = total - len(seen)
+    if duplicates:
+        print(f"Dropped {duplicates} duplicate handles")
+    return list(seen.values())
+
+def _upsert_chunk(chunk: List[Dict[str, str]], update_existing: bool) -> int:
+    try:
+        with track("supabase", "upsert:influencers"):
+            response = get_supabase().table('influencers').upsert(
+                chunk,
+                on_conflict="tiktok_handle",
+                ignore_duplicates=not update_existing
+            ).execute()
+        return len(response.data or [])
+    except Exception as e:
+        print(f"Error inserting data into Supabase: {str(e)}")
+        return 0
+
+def ingest_stream(
+    records: Iterable[Dict[str, str]],
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    update_existing: bool = False
+) -> Dict[str, int]:
+    """
+    Upsert records from any iterable, `chunk_size` at a time, holding at most one
+    chunk in memory. Duplicates inside a chunk are dropped here; duplicates across
+    chunks are resolved by the unique handle in the table.
+    """
+    stats = {"read": 0, "written": 0, "chunks": 0}
+    chunk: Dict[str, Dict[str, str]] = {}
+
+    def flush():
+        stats["written"] += _upsert_chunk(list(chunk.values()), update_existing)
+        stats["chunks"] += 1
+        chunk.clear()
+
+    for record in records:
+        stats["read"] += 1
+        chunk.setdefault(record["tiktok_handle"], record)
+        if len(chunk) >= chunk_size:
+            flush()
+            print(f"Ingested {stats['read']} records, {stats['written']} new")
+    if chunk:
+        flush()
+
+    print(f"Read {stats['read']} records, wrote {stats['written']} in {stats['chunks']} chunks")
+    return stats
+
+def insert_influencers(
+    influencers: List[Dict[str, str]],
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    update_existing: bool = False
+) -> int:
+    """
+    Upsert influencer records into Supabase on their unique handle, in chunks.
+    Handles already in the table are left untouched unless `update_existing`,
+    so rerunning an ingest is a no-op. Returns the number of rows written.
+    """
+    influencers = dedupe_influencers(influencers)
+    written = 0
+    for start in range(0, len(influencers), chunk_size):
+        written += _upsert_chunk(influencers[start:start + chunk_size], update_existing)
+    print(f"Successfully added {written} of {len(influencers)} influencers to the database")
+    return written
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load influencers into Supabase.")
+    parser.add_argument("paths", nargs="*", help="roster files to stream in, - for stdin; the built-in roster when omitted")
+    parser.add_argument("--format", choices=sorted(READERS), help="input format, detected from the extension by default")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument("--update-existing", action="store_true", help="overwrite name and category of known handles")
+    args = parser.parse_args()
+
+    if args.paths:
+        ingest_stream(
+            (record for path in args.paths for record in read_records(path, args.format)),
+            chunk_size=args.chunk_size,
+            update_existing=args.update_existing
+        )
+    else:
+        insert_influencers(parse_influencers(input_text), args.chunk_size, args.update_existing)
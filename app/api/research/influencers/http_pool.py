@@ -0,0 +1,52 @@
+import os
+import asyncio
+from typing import Dict, Optional, Tuple
+import httpx
+
+# Pool limits, overridable per client with a <NAME>_ prefix (e.g. PERPLEXITY_MAX_CONNECTIONS)
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+DEFAULT_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# One client per name, remembered together with the event loop it was opened on
+_clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+
+def _env_setting(name: str, key: str, default):
+    value = os.getenv(f"{name.upper()}_{key}")
+    return type(default)(value) if value is not None else default
+
+def get_limits(name: str) -> httpx.Limits:
+    """Build the connection pool limits for a named client."""
+    return httpx.Limits(
+        max_connections=_env_setting(name, "MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS),
+        max_keepalive_connections=_env_setting(name, "MAX_KEEPALIVE_CONNECTIONS", DEFAULT_MAX_KEEPALIVE),
+        keepalive_expiry=_env_setting(name, "KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY),
+    )
+
+def get_async_client(name: str, timeout: float = 100.0, limits: Optional[httpx.Limits] = None) -> httpx.AsyncClient:
+    """
+    Return the long-lived pooled HTTP/2 client registered under `name`, creating it
+    on first use. A client opened on a different (finished) event loop is replaced.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(name)
+    if entry is not None:
+        client, client_loop = entry
+        if not client.is_closed and client_loop is loop:
+            return client
+
+    client = httpx.AsyncClient(
+        http2=True,
+        timeout=timeout,
+        limits=limits or get_limits(name),
+    )
+    _clients[name] = (client, loop)
+    return client
+
+async def close_async_clients() -> None:
+    """Close every pooled client opened on the running event loop."""
+    loop = asyncio.get_running_loop()
+    for name, (client, client_loop) in list(_clients.items()):
+        if client_loop is loop:
+            await client.aclose()
+            del _clients[name]
@@ -0,0 +1,163 @@
+import io
+import os
+import base64
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import httpx
+
+IMAGE_DIR = os.getenv(
+    "IMAGE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "images")
+)
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "512"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "low")  # OpenAI vision detail: low | high | auto
+IMAGE_FETCH_TIMEOUT = 30.0
+
+@dataclass
+class StoredImage:
+    url: str
+    content_hash: str
+    path: str
+    etag: Optional[str] = None
+
+    def data_url(self) -> str:
+        with open(self.path, "rb") as f:
+            return f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+class ImageStore:
+    """
+    Downloads each image URL once, keeps a downscaled JPEG per distinct image content
+    (so several URLs pointing at the same picture share one file) and hands out
+    base64 data URLs for vision prompts.
+    """
+
+    def __init__(
+        self,
+        directory: str = IMAGE_DIR,
+        max_dimension: int = IMAGE_MAX_DIMENSION,
+        quality: int = IMAGE_JPEG_QUALITY
+    ):
+        self.directory = directory
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._http: Optional[httpx.Client] = None
+        self._http_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    url TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    etag TEXT
+                )
+            """)
+            self._conn = conn
+            self._pid = os.getpid()
+            self._http = None
+        return self._conn
+
+    def _client(self) -> httpx.Client:
+        # Called from description worker threads; only one of them may create it
+        with self._http_lock:
+            if self._http is None:
+                self._http = httpx.Client(timeout=IMAGE_FETCH_TIMEOUT, follow_redirects=True)
+            return self._http
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}_{self.max_dimension}_{self.quality}.jpg")
+
+    def _lookup(self, url: str) -> Optional[StoredImage]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT content_hash, etag FROM images WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredImage(url, row[0], self._path(row[0]), row[1])
+
+    def _downscale(self, content: bytes, path: str) -> None:
+        from PIL import Image  # Only paid for when an image is actually processed
+        image = Image.open(io.BytesIO(content))
+        image = image.convert("RGB")
+        image.thumbnail((self.max_dimension, self.max_dimension))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, "JPEG", quality=self.quality, optimize=True)
+        os.replace(tmp_path, path)
+
+    def get(self, url: str, refresh: bool = False, revalidate: bool = False) -> Optional[StoredImage]:
+        """
+        Return the stored image for `url`, downloading it on first use (or when
+        `refresh` is set). With `revalidate`, a stored image is checked against the
+        server with its ETag and re-downloaded only if it changed. Returns None if
+        the image can't be fetched or decoded.
+        """
+        stored = self._lookup(url)
+        if stored is not None and not os.path.exists(stored.path):
+            stored = None
+        if stored is not None and not refresh and not revalidate:
+            return stored
+
+        headers = {}
+        if stored is not None and revalidate and not refresh and stored.etag:
+            headers["If-None-Match"] = stored.etag
+
+        try:
+            response = self._client().get(url, headers=headers)
+            if response.status_code == 304 and stored is not None:
+                return stored
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Error downloading image {url}: {str(e)}")
+            return None
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        path = self._path(content_hash)
+        if not os.path.exists(path):
+            try:
+                self._downscale(response.content, path)
+            except Exception as e:
+                print(f"Error decoding image {url}: {str(e)}")
+                return None
+
+        etag = response.headers.get("ETag")
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO images (url, content_hash, etag) VALUES (?, ?, ?)",
+                (url, content_hash, etag)
+            )
+            conn.commit()
+        return StoredImage(url, content_hash, path, etag)
+
+_store: Optional[ImageStore] = None
+_store_lock = threading.Lock()
+
+def get_image_store() -> ImageStore:
+    """Process-wide image store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ImageStore()
+    return _store
+
+def prepare_image(url: str) -> Tuple[str, str]:
+    """
+    Return (url_for_provider, cache_identity) for a vision call: a downscaled data URL
+    and its content hash, or the original URL twice if the image can't be stored.
+    """
+    stored = get_image_store().get(url)
+    if stored is None:
+        return url, url
+    return stored.data_url(), stored.content_hash
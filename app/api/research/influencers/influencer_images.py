@@ -1,25 +1,74 @@
 import os
-import requests
-from supabase import create_client, Client
-from typing import Optional
+import asyncio
+import hashlib
+import httpx
+from typing import Awaitable, Callable, Dict, Optional
+from response_cache import get_response_cache
+from http_pool import get_async_client, close_async_clients
+from supabase_reader import iter_rows, for_each_row
+from rate_limit import TokenBucket, get_limiter, get_concurrency
+from metrics import track, record_retry, start_run, finish_run
+from clients import get_supabase
 from dotenv import load_dotenv
-import time
 
 # Load environment variables
 load_dotenv('.env.local')
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
-
 # Initialize Brave Search API
 BRAVE_API_KEY = os.getenv("BRAVE_API_KEY")
-BRAVE_SEARCH_URL = "https://api.search.brave.com/res/v1/images/search"
+BRAVE_SEARCH_URL = os.getenv("BRAVE_SEARCH_URL", "https://api.search.brave.com/res/v1/images/search")
+BRAVE_RPM = 60  # Free plan is 1 request/second; overridable with BRAVE_RPM / BRAVE_BURST
+BRAVE_CONCURRENCY = int(os.getenv("BRAVE_CONCURRENCY", "4"))
+BRAVE_HEALTH_TTL = float(os.getenv("BRAVE_HEALTH_TTL", str(24 * 3600)))
+BRAVE_HEALTH_QUERY = "Barack Obama"
+
+# Returns True when the API is usable; see brave_health_check
+HealthCheck = Callable[[], Awaitable[bool]]
+
+def get_brave_limiter() -> TokenBucket:
+    return get_limiter("brave", default_rpm=BRAVE_RPM)
+
+def _health_key() -> str:
+    # Per API key, so a new key is checked again
+    fingerprint = hashlib.sha256((BRAVE_API_KEY or "").encode("utf-8")).hexdigest()[:16]
+    return get_response_cache().make_key("brave", "health", BRAVE_HEALTH_QUERY, key=fingerprint)
+
+def _first_int(header: Optional[str]) -> Optional[int]:
+    # Brave reports "<per-second>, <per-month>" in its X-RateLimit-* headers
+    if not header:
+        return None
+    try:
+        return int(float(header.split(",")[0].strip()))
+    except ValueError:
+        return None
 
-def fetch_image_url(name: str) -> Optional[str]:
+def apply_rate_limit_headers(response: httpx.Response, limiter: TokenBucket) -> None:
     """
-    Fetch the first image URL from Brave Search for a given name
+    Keep the token bucket in line with what Brave reports: adopt the plan's
+    per-second limit and pause until the window resets when it is used up.
+    """
+    limit = _first_int(response.headers.get("X-RateLimit-Limit"))
+    if limit and limit > 0 and limit != limiter.rate:
+        limiter.set_rate(limit, burst=limit)
+
+    remaining = _first_int(response.headers.get("X-RateLimit-Remaining"))
+    reset = _first_int(response.headers.get("X-RateLimit-Reset"))
+    if remaining == 0 and reset:
+        limiter.pause(reset)
+
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After")
+        try:
+            delay = float(retry_after) if retry_after else float(reset or 1)
+        except ValueError:
+            delay = float(reset or 1)
+        limiter.pause(delay)
+
+async def search_image(name: str, max_retries: int = 3) -> Optional[str]:
+    """
+    Query Brave image search for `name` and return the first image URL, waiting on
+    the shared token bucket and retrying after 429s. Returns None only when the
+    search has no results; a rejected key or any other error raises.
     """
     headers = {
         "Accept": "application/json",
@@ -27,37 +76,37 @@ def fetch_image_url(name: str) -> Optional[str]:
     }
     
     params = {
-        "q": f"{name}",  # Simplified query for testing
+        "q": f"{name}",
         "count": 1
     }
-    
-    print(f"\nDebug info for {name}:")
-    print(f"API Key being used: {BRAVE_API_KEY[:5]}...")
-    print(f"Full URL: {BRAVE_SEARCH_URL}?q={params['q']}")
-    print(f"Headers: {headers}")
-    
-    try:
-        # Rate limiting - sleep for 1.1 seconds between requests
-        time.sleep(1.1)
-        
-        response = requests.get(
-            BRAVE_SEARCH_URL, 
-            headers=headers, 
-            params=params
-        )
-        
-        print(f"Response status code: {response.status_code}")
-        print(f"Response headers: {dict(response.headers)}")
-        
-        if response.status_code == 403:
+
+    client = get_async_client("brave", timeout=30.0)
+    limiter = get_brave_limiter()
+
+    for attempt in range(max_retries):
+        await limiter.acquire()
+        async with get_concurrency("brave").slot() as slot:
+            with track("brave", "images/search") as call:
+                response = await client.get(BRAVE_SEARCH_URL, headers=headers, params=params)
+                call.status_code = response.status_code
+                call.bytes_received = len(response.content)
+                slot.throttled = response.status_code == 429
+        apply_rate_limit_headers(response, limiter)
+
+        if response.status_code == 429 and attempt < max_retries - 1:
+            print(f"Rate limited searching for {name}, retrying...")
+            record_retry("brave", "images/search")
+            continue
+
+        if response.status_code in (401, 403):
             print(f"Authentication error. Please check your Brave API key. Status: {response.status_code}")
             print(f"Response: {response.text}")
-            return None
-            
+            # Make the next run's health check ask Brave instead of trusting its cache
+            get_response_cache().set(_health_key(), None)
+
         response.raise_for_status()
         
         results = response.json()
-        print(f"API Response for {name}:", results)
         
         # Extract URL from the correct location in the response
         if "results" in results and results["results"]:
@@ -69,28 +118,73 @@ def fetch_image_url(name: str) -> Optional[str]:
         
         print(f"No results found in response for {name}")
         return None
-        
+
+    return None
+
+async def fetch_image_url(name: str) -> Optional[str]:
+    """
+    Fetch the first image URL from Brave Search for a given name
+    """
+    cache = get_response_cache()
+    cache_key = cache.make_key("brave", "images/search", name)
+    hit, cached = cache.get(cache_key)
+    if hit:
+        return cached
+
+    try:
+        image_url = await search_image(name)
     except Exception as e:
         print(f"Error fetching image for {name}: {str(e)}")
         print(f"Full error response: {getattr(e, 'response', {}).text if hasattr(e, 'response') else 'No response'}")
         return None
 
+    # A search with no results is cached as a negative result
+    cache.set(cache_key, image_url)
+    return image_url
+
+async def brave_health_check() -> bool:
+    """
+    Run one known-good query, remembering a success for BRAVE_HEALTH_TTL so
+    repeated runs don't spend a request on it. The success is forgotten as soon
+    as any search is rejected with 401/403.
+    """
+    cache = get_response_cache()
+    cache_key = _health_key()
+    hit, cached = cache.get(cache_key)
+    if hit and cached:
+        return True
+
+    try:
+        healthy = await search_image(BRAVE_HEALTH_QUERY) is not None
+    except Exception as e:
+        print(f"Brave health check failed: {str(e)}")
+        return False
+
+    if healthy:
+        cache.set(cache_key, True, ttl=BRAVE_HEALTH_TTL)
+    return healthy
+
 def update_influencer_image_url(influencer_id: str, image_url: str) -> bool:
     """
     Update the image_url column for an influencer
     """
     try:
-        supabase.table("influencers").update(
-            {"image_url": image_url}
-        ).eq("id", influencer_id).execute()
+        with track("supabase", "update:influencers"):
+            get_supabase().table("influencers").update(
+                {"image_url": image_url}
+            ).eq("id", influencer_id).execute()
         return True
     except Exception as e:
         print(f"Error updating image_url for influencer {influencer_id}: {str(e)}")
         return False
 
-def process_all_influencers():
+async def process_all_influencers(
+    concurrency: int = BRAVE_CONCURRENCY,
+    health_check: Optional[HealthCheck] = brave_health_check
+):
     """
-    Process all influencers in the database
+    Process all influencers in the database. Requests are paced by the shared Brave
+    token bucket; `concurrency` only bounds how many are in flight.
     """
     # Verify API key is set and looks valid
     if not BRAVE_API_KEY:
@@ -100,47 +194,59 @@ def process_all_influencers():
     if BRAVE_API_KEY == "your_brave_api_key_here":
         print("Error: BRAVE_API_KEY appears to be the placeholder value. Please update with your actual API key")
         return
-        
-    print(f"Using Brave API key: {BRAVE_API_KEY[:10]}...")
     
-    # Test with a known good search term
-    print("\nTesting API with a simple query...")
-    test_result = fetch_image_url("Barack Obama")
-    if test_result is None:
-        print("Initial API test failed. Please check your API key and connection.")
-        return
-    else:
+    if health_check is not None:
+        if not await health_check():
+            print("Initial API test failed. Please check your API key and connection.")
+            return
         print("Initial API test successful!")
     
-    # Fetch all influencers from the database that don't have an image_url yet
-    response = supabase.table("influencers").select("id, name").is_("image_url", None).execute()
-    
-    total = len(response.data)
-    print(f"Found {total} influencers to process")
-    
-    for i, influencer in enumerate(response.data, 1):
+    # Stream the influencers that don't have an image_url yet, page by page
+    influencers = iter_rows(
+        get_supabase(),
+        "influencers",
+        "id, name",
+        where=lambda query: query.is_("image_url", "null")
+    )
+    processed = 0
+
+    async def process(influencer: Dict) -> None:
+        nonlocal processed
+        processed += 1
+        i = processed
         influencer_id = influencer["id"]
         name = influencer["name"]
         
-        print(f"\nProcessing {i}/{total}: {name}")
+        print(f"\nProcessing {i}: {name}")
         
         # Skip if name is empty
         if not name:
             print(f"Skipping {name} - empty name")
-            continue
+            return
             
         # Fetch image URL from Brave Search
-        image_url = fetch_image_url(name)
+        image_url = await fetch_image_url(name)
         if not image_url:
             print(f"No image URL found for {name}")
-            continue
+            return
             
         # Update the database with the image URL
-        success = update_influencer_image_url(influencer_id, image_url)
+        success = await asyncio.to_thread(update_influencer_image_url, influencer_id, image_url)
         if success:
             print(f"Successfully updated image URL for {name}")
         else:
             print(f"Failed to update image URL for {name}")
 
+    total = await for_each_row(influencers, process, concurrency)
+    print(f"Processed {total} influencers")
+
+async def main():
+    start_run()
+    try:
+        await process_all_influencers()
+    finally:
+        await close_async_clients()
+        finish_run()
+
 if __name__ == "__main__":
-    process_all_influencers()
+    asyncio.run(main())
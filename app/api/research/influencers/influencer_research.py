@@ -1,14 +1,58 @@
 import os
 import json
-from typing import TypedDict, List, Optional, Literal
+import math
+import time
+import heapq
+import typing
+from collections import Counter
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, TypedDict, Dict, List, Optional, Literal
 import httpx
 import asyncio
-from supabase import create_client, Client
+from clients import get_supabase, supabase_configured
+from http_pool import get_async_client, close_async_clients
+from rate_limit import get_limiter, configure_limiter, get_concurrency, RateLimitError, is_rate_limited, retry_after
+from response_cache import get_response_cache
+from supabase_writer import BulkUpsertWriter
+from citation_store import CitationWriter
+from supabase_reader import iter_rows, for_each_row
+from work_journal import WorkJournal, get_work_journal
+from metrics import track, record_retry, start_run, finish_run
 
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
-PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
-SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+PERPLEXITY_API_URL = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
+PERPLEXITY_MODEL = "sonar"
+PERPLEXITY_TIMEOUT = 100.0
+PERPLEXITY_RPM = 50  # Provider-wide default budget, overridable with PERPLEXITY_RPM
+# Bump when the shape of cached query_perplexity results changes; v2 stores the
+# raw JSON answer plus citations and usage instead of a wrapped section
+PERPLEXITY_CACHE_VERSION = 2
+RESEARCH_CONCURRENCY = int(os.getenv("RESEARCH_CONCURRENCY", "4"))  # Influencers in flight
+RESEARCH_WRITE_BATCH_SIZE = int(os.getenv("RESEARCH_WRITE_BATCH_SIZE", "50"))
+RESEARCH_WRITE_FLUSH_INTERVAL = float(os.getenv("RESEARCH_WRITE_FLUSH_INTERVAL", "10"))
+# fanout | combined; stays fanout until --compare shows combined sections are as complete
+RESEARCH_STRATEGY = os.getenv("RESEARCH_STRATEGY", "fanout")
+COMBINED_MAX_TOKENS = 6000  # Room for all four sections in one answer
+REFRESH_REQUEST_BUDGET = int(os.getenv("REFRESH_REQUEST_BUDGET", "200"))  # Perplexity calls per refresh run
+DAY = 24 * 3600
+
+def parse_ttls(value: str) -> Dict[str, float]:
+    """Parse `area=days` pairs, e.g. "content=7,background=90"."""
+    ttls = {}
+    for pair in value.split(","):
+        if pair.strip():
+            area, _, days = pair.partition("=")
+            ttls[area.strip()] = float(days)
+    return ttls
+
+# How many days each research area stays fresh before --refresh re-researches it
+RESEARCH_TTL_DAYS = {
+    "content": 7,
+    "background": 90,
+    "targetAudience": 30,
+    "keyTopics": 30,
+    **parse_ttls(os.getenv("RESEARCH_TTL_DAYS", "")),
+}
 
 class ContentData(TypedDict):
     mainCategories: List[str]
@@ -42,6 +86,17 @@ class ResearchData(TypedDict):
 class ResearchResult(TypedDict):
     data: ResearchData
     citations: List[str]
+    usage: Dict[str, int]
+
+def get_perplexity_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for all Perplexity calls on the running event loop."""
+    return get_async_client("perplexity", timeout=PERPLEXITY_TIMEOUT)
+
+def _retry_after_header(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
 
 def clean_json_response(content: str) -> str:
     """Clean the JSON response from Perplexity API."""
@@ -52,200 +107,502 @@ def clean_json_response(content: str) -> str:
         json_match = json_match[3:-3]
     return json_match.strip()
 
-async def perform_specialized_research(
-    area: str,
-    description: str,
-    prompt: str,
-    name: str,
-    tiktok_profile_link: str
-) -> ResearchResult:
+# Per-area research prompts; the JSON template each asks for is generated from
+# the area's TypedDict so the prompts and the validation can't drift apart
+RESEARCH_AREAS = [
+    {
+        "name": "content",
+        "description": "Content Analysis",
+        "schema": ContentData,
+        "focus": """Analyze the influencer's content in detail.
+Focus on:
+1. Main content categories and themes
+2. Content style and tone
+3. Posting frequency and consistency
+4. Engagement metrics
+5. Popular content formats"""
+    },
+    {
+        "name": "background",
+        "description": "Background Information",
+        "schema": BackgroundData,
+        "focus": """Research the influencer's background and expertise.
+Focus on:
+1. Professional and personal biography
+2. Areas of expertise
+3. Notable achievements
+4. Career progression and highlights"""
+    },
+    {
+        "name": "targetAudience",
+        "description": "Target Audience Analysis",
+        "schema": TargetAudienceData,
+        "focus": """Analyze the influencer's target audience.
+Focus on:
+1. Demographic information
+2. Audience interests and preferences
+3. Geographic distribution
+4. Engagement patterns"""
+    },
+    {
+        "name": "keyTopics",
+        "description": "Key Topics & Themes",
+        "schema": KeyTopicsData,
+        "focus": """Analyze the main topics and themes in the influencer's content.
+Focus on:
+1. Primary content topics
+2. Recurring themes and messages
+3. Brand collaborations and alignments
+4. Overall value proposition"""
+    }
+]
+
+def _schema_template(schema: type, indent: str = "") -> str:
+    """Render a TypedDict as the JSON-ish template used in the prompts."""
+    fields = [
+        f'{indent}  "{key}": {"string[]" if typing.get_origin(hint) in (list, List) else "string"}'
+        for key, hint in typing.get_type_hints(schema).items()
+    ]
+    return "{\n" + ",\n".join(fields) + f"\n{indent}}}"
+
+def area_prompt(area: Dict) -> str:
+    return f"""{area["focus"]}
+
+Format your response as JSON:
+{_schema_template(area["schema"])}"""
+
+def combined_prompt(areas: Optional[List[Dict]] = None) -> str:
+    """One prompt asking for several research areas as sections of a single JSON object."""
+    areas = areas or RESEARCH_AREAS
+    sections = "\n\n".join(
+        f"{area['name']} ({area['description']}):\n{area['focus']}" for area in areas
+    )
+    template = ",\n".join(
+        f'  "{area["name"]}": {_schema_template(area["schema"], "  ")}' for area in areas
+    )
+    return f"""Cover each of the following areas.
+
+{sections}
+
+Format your response as a single JSON object with one key per area:
+{{
+{template}
+}}"""
+
+def validate_section(area: Dict, data) -> bool:
+    """True if `data` has every field of the area's TypedDict with the right type."""
+    if not isinstance(data, dict):
+        return False
+    for key, hint in typing.get_type_hints(area["schema"]).items():
+        value = data.get(key)
+        if typing.get_origin(hint) in (list, List):
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                return False
+        elif not isinstance(value, str):
+            return False
+    return True
+
+def section_completeness(area: Dict, data) -> float:
+    """Share of the area's fields that are present and non-empty."""
+    if not isinstance(data, dict):
+        return 0.0
+    keys = list(typing.get_type_hints(area["schema"]))
+    return sum(1 for key in keys if data.get(key)) / len(keys)
+
+async def query_perplexity(prompt: str, max_tokens: int = 2000, fresh: bool = False) -> Dict:
     """
-    Perform specialized research for a specific area of influencer analysis.
+    Ask Perplexity for a JSON answer to `prompt`. Returns the parsed JSON as
+    `data` together with the response's `citations` and token `usage`. With
+    `fresh` a cached answer is ignored (and replaced by the new one).
     """
     if not PERPLEXITY_API_KEY:
         raise ValueError("PERPLEXITY_API_KEY not configured")
 
-    full_prompt = f"""Research the TikTok influencer {name} (profile: {tiktok_profile_link}).
-{prompt}"""
+    system_prompt = "You are a specialized research agent that MUST ALWAYS respond with valid JSON only. Do not include any text before or after the JSON."
 
+    cache = get_response_cache()
+    cache_key = cache.make_key(
+        "perplexity",
+        PERPLEXITY_MODEL,
+        f"{system_prompt}\n{prompt}",
+        temperature=0.1,
+        max_tokens=max_tokens,
+        version=PERPLEXITY_CACHE_VERSION
+    )
+    if not fresh:
+        hit, cached = cache.get(cache_key)
+        if hit and cached:
+            return cached
+
+    client = get_perplexity_client()
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            async with httpx.AsyncClient(timeout=100.0) as client:  # Increased timeout to 100 seconds
-                response = await client.post(
-                    PERPLEXITY_API_URL,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
-                    },
-                    json={
-                        "model": "sonar",
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "You are a specialized research agent that MUST ALWAYS respond with valid JSON only. Do not include any text before or after the JSON."
-                            },
-                            {
-                                "role": "user",
-                                "content": full_prompt
-                            }
-                        ],
-                        "temperature": 0.1,
-                        "max_tokens": 2000,
-                        "response_format": {"type": "text"}
-                    },
-                )
-                
-                data = response.json()
-                
-                if not response.status_code == 200:
-                    raise Exception(f"API returned status code {response.status_code}: {data}")
-                
-                if "choices" not in data or not data["choices"]:
-                    raise Exception(f"No choices in API response: {data}")
-                    
-                cleaned_content = clean_json_response(data["choices"][0]["message"]["content"])
-                research_data = json.loads(cleaned_content)
+            await get_limiter("perplexity", default_rpm=PERPLEXITY_RPM).acquire()
+            async with get_concurrency("perplexity").slot():
+                with track("perplexity", "chat.completions") as call:
+                    response = await client.post(
+                        PERPLEXITY_API_URL,
+                        headers={
+                            "Content-Type": "application/json",
+                            "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
+                        },
+                        json={
+                            "model": PERPLEXITY_MODEL,
+                            "messages": [
+                                {
+                                    "role": "system",
+                                    "content": system_prompt
+                                },
+                                {
+                                    "role": "user",
+                                    "content": prompt
+                                }
+                            ],
+                            "temperature": 0.1,
+                            "max_tokens": max_tokens,
+                            "response_format": {"type": "text"}
+                        },
+                    )
+                    call.status_code = response.status_code
+                    call.bytes_sent = len(response.request.content)
+                    call.bytes_received = len(response.content)
+                    if response.status_code == 429:
+                        # Raised inside the slot so the concurrency limit backs off
+                        raise RateLimitError(
+                            f"API returned status code 429: {response.text}",
+                            retry_after=_retry_after_header(response)
+                        )
+                    data = response.json()
+                    if isinstance(data, dict):
+                        call.usage(data.get("usage"))
+            
+            if not response.status_code == 200:
+                raise Exception(f"API returned status code {response.status_code}: {data}")
+            
+            if "choices" not in data or not data["choices"]:
+                raise Exception(f"No choices in API response: {data}")
                 
-                return {
-                    "data": {
-                        "type": area,
-                        "data": research_data
-                    },
-                    "citations": data.get("citations", [])
-                }
+            cleaned_content = clean_json_response(data["choices"][0]["message"]["content"])
+            result = {
+                "data": json.loads(cleaned_content),
+                "citations": data.get("citations", []),
+                "usage": data.get("usage") or {}
+            }
+            cache.set(cache_key, result)
+            return result
 
         except httpx.TimeoutException as e:
             if attempt == max_retries - 1:  # Last attempt
                 raise
+            record_retry("perplexity", "chat.completions")
             await asyncio.sleep(2 * (attempt + 1))  # Exponential backoff
         except Exception as e:
             raise
 
-async def research_influencer(name: str, tiktok_profile_link: str) -> dict:
+async def perform_specialized_research(
+    area: str,
+    description: str,
+    prompt: str,
+    name: str,
+    tiktok_profile_link: str,
+    fresh: bool = False
+) -> ResearchResult:
     """
-    Research an influencer using multiple specialized API calls and store in Supabase.
+    Perform specialized research for a specific area of influencer analysis.
     """
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        raise ValueError("Supabase credentials not configured")
-        
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-    research_areas = [
-        {
-            "name": "content",
-            "description": "Content Analysis",
-            "prompt": """Analyze the influencer's content in detail.
-Focus on:
-1. Main content categories and themes
-2. Content style and tone
-3. Posting frequency and consistency
-4. Engagement metrics
-5. Popular content formats
+    full_prompt = f"""Research the TikTok influencer {name} (profile: {tiktok_profile_link}).
+{prompt}"""
 
-Format your response as JSON:
-{
-  "mainCategories": string[],
-  "contentStyle": string,
-  "postFrequency": string,
-  "engagementRate": string,
-  "popularContentTypes": string[]
-}"""
+    response = await query_perplexity(full_prompt, fresh=fresh)
+    return {
+        "data": {
+            "type": area,
+            "data": response["data"]
         },
-        {
-            "name": "background",
-            "description": "Background Information",
-            "prompt": """Research the influencer's background and expertise.
-Focus on:
-1. Professional and personal biography
-2. Areas of expertise
-3. Notable achievements
-4. Career progression and highlights
+        "citations": response["citations"],
+        "usage": response["usage"]
+    }
 
-Format your response as JSON:
-{
-  "biography": string,
-  "expertise": string[],
-  "achievements": string[],
-  "careerHighlights": string[]
-}"""
-        },
-        {
-            "name": "targetAudience",
-            "description": "Target Audience Analysis",
-            "prompt": """Analyze the influencer's target audience.
-Focus on:
-1. Demographic information
-2. Audience interests and preferences
-3. Geographic distribution
-4. Engagement patterns
+async def perform_combined_research(
+    name: str,
+    tiktok_profile_link: str,
+    areas: Optional[List[Dict]] = None,
+    fresh: bool = False
+) -> Dict:
+    """
+    Research several areas (all by default) in one Perplexity call. Returns the
+    sections that passed validation (keyed by area name) and the citations of the call.
+    """
+    areas = areas or RESEARCH_AREAS
+    full_prompt = f"""Research the TikTok influencer {name} (profile: {tiktok_profile_link}).
+{combined_prompt(areas)}"""
 
-Format your response as JSON:
-{
-  "demographics": string[],
-  "interests": string[],
-  "locationFocus": string,
-  "engagementPatterns": string
-}"""
-        },
-        {
-            "name": "keyTopics",
-            "description": "Key Topics & Themes",
-            "prompt": """Analyze the main topics and themes in the influencer's content.
-Focus on:
-1. Primary content topics
-2. Recurring themes and messages
-3. Brand collaborations and alignments
-4. Overall value proposition
+    response = await query_perplexity(full_prompt, max_tokens=COMBINED_MAX_TOKENS, fresh=fresh)
+    data = response["data"] if isinstance(response["data"], dict) else {}
+    sections = {}
+    for area in areas:
+        if validate_section(area, data.get(area["name"])):
+            sections[area["name"]] = data[area["name"]]
+        else:
+            print(f"Combined research for {name}: section {area['name']} failed validation")
+    return {"sections": sections, "citations": response["citations"], "usage": response["usage"]}
 
-Format your response as JSON:
-{
-  "primaryTopics": string[],
-  "recurringThemes": string[],
-  "brandAlignments": string[],
-  "valueProposition": string
-}"""
+class PartialResearchError(Exception):
+    """Some research areas failed; the ones that succeeded were kept."""
+
+    def __init__(self, name: str, errors: Dict[str, BaseException]):
+        self.errors = errors
+        details = "; ".join(f"{area}: {str(error)}" for area, error in errors.items())
+        super().__init__(f"{len(errors)} research areas failed for {name} ({details})")
+
+class BudgetExhausted(Exception):
+    """The run's Perplexity request budget is spent."""
+
+class RequestBudget:
+    """A fixed number of Perplexity requests shared by every influencer of a run."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.spent = 0
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.spent)
+
+    def spend(self, requests: int = 1) -> None:
+        if self.spent + requests > self.limit:
+            raise BudgetExhausted(f"request budget of {self.limit} spent")
+        self.spent += requests
+
+def _budget_exhausted(error: BaseException) -> bool:
+    if isinstance(error, PartialResearchError):
+        return any(isinstance(e, BudgetExhausted) for e in error.errors.values())
+    return isinstance(error, BudgetExhausted) or isinstance(error.__cause__, BudgetExhausted)
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+# Called with (area name, {"data": section, "citations": [...], "researchedAt": ...}) as each area completes
+SectionCallback = Callable[[str, Dict], None]
+
+async def gather_research(
+    name: str,
+    tiktok_profile_link: str,
+    strategy: str = RESEARCH_STRATEGY,
+    completed: Optional[Dict[str, Dict]] = None,
+    on_section: Optional[SectionCallback] = None,
+    fresh: bool = False,
+    budget: Optional[RequestBudget] = None
+) -> Dict:
+    """
+    Collect every research area for an influencer. The "combined" strategy asks
+    for all missing areas in one call and falls back to per-area calls only for
+    sections that came back missing or invalid; "fanout" makes one call per area.
+
+    Areas already in `completed` are not requested again, and every area that
+    succeeds is added to it (and passed to `on_section`) as soon as it is in, so
+    a retry after a PartialResearchError only pays for the areas that failed.
+    Each call is charged to `budget` first and not made once it is spent.
+    Also returns the request count and token `usage` it took, and when each
+    newly researched area was researched.
+    """
+    completed = {} if completed is None else completed
+    usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def add_usage(call_usage: Dict) -> None:
+        usage["requests"] += 1
+        usage["prompt_tokens"] += call_usage.get("prompt_tokens", 0) or 0
+        usage["completion_tokens"] += call_usage.get("completion_tokens", 0) or 0
+
+    def record(area_name: str, section: Dict, citations: List[str]) -> None:
+        entry = {"data": section, "citations": citations, "researchedAt": _now_iso()}
+        completed[area_name] = entry
+        if on_section is not None:
+            on_section(area_name, entry)
+
+    missing = [area for area in RESEARCH_AREAS if area["name"] not in completed]
+    # A single missing area is cheaper to ask for on its own
+    if strategy == "combined" and len(missing) > 1:
+        if budget is not None:
+            budget.spend()
+        try:
+            combined = await perform_combined_research(name, tiktok_profile_link, missing, fresh)
+            add_usage(combined["usage"])
+            for area_name, section in combined["sections"].items():
+                record(area_name, section, combined["citations"])
+        except Exception as e:
+            if is_rate_limited(e):
+                raise
+            print(f"Combined research for {name} failed, falling back to per-area calls: {str(e)}")
+
+    async def research_area(area: Dict) -> None:
+        if budget is not None:
+            budget.spend()
+        result = await perform_specialized_research(
+            area["name"],
+            area["description"],
+            area_prompt(area),
+            name,
+            tiktok_profile_link,
+            fresh
+        )
+        add_usage(result["usage"])
+        record(area["name"], result["data"]["data"], result["citations"])
+
+    missing = [area for area in RESEARCH_AREAS if area["name"] not in completed]
+    outcomes = await asyncio.gather(*(research_area(area) for area in missing), return_exceptions=True)
+    errors = {
+        area["name"]: outcome
+        for area, outcome in zip(missing, outcomes)
+        if isinstance(outcome, BaseException)
+    }
+    if errors:
+        # Chain a rate limit error, if any, so callers back off instead of retrying at once
+        cause = next((e for e in errors.values() if is_rate_limited(e)), next(iter(errors.values())))
+        raise PartialResearchError(name, errors) from cause
+
+    citations = [citation for entry in completed.values() for citation in entry["citations"]]
+    return {
+        "sections": {area_name: entry["data"] for area_name, entry in completed.items()},
+        "citations": citations,
+        "usage": usage,
+        "researched_at": {
+            area_name: entry["researchedAt"]
+            for area_name, entry in completed.items()
+            if entry.get("researchedAt")
         }
-    ]
+    }
+
+def merge_research(
+    existing: Optional[Dict],
+    sections: Dict[str, Dict],
+    researched_at: Optional[Dict[str, str]] = None
+) -> Dict:
+    """
+    Merge freshly researched areas into an influencer's stored research, area by
+    area. `researchedAt` keeps when each area was last researched. Citations
+    live in the citation tables, so any still embedded are dropped.
+    """
+    merged = dict(existing or {})
+    merged.update(sections)
+    merged.pop("citations", None)
+    merged["researchedAt"] = {**(merged.get("researchedAt") or {}), **(researched_at or {})}
+    return merged
 
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
     try:
-        research_promises = [
-            perform_specialized_research(
-                area["name"],
-                area["description"],
-                area["prompt"],
-                name,
-                tiktok_profile_link
-            )
-            for area in research_areas
-        ]
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
 
-        research_results = await asyncio.gather(*research_promises)
-        
-        # Consolidate all citations
-        all_citations = []
-        for result in research_results:
-            all_citations.extend(result["citations"])
-        unique_citations = list(set(all_citations))
-
-        # Extract research data
-        content = next(r for r in research_results if r["data"]["type"] == "content")
-        background = next(r for r in research_results if r["data"]["type"] == "background")
-        target_audience = next(r for r in research_results if r["data"]["type"] == "targetAudience")
-        key_topics = next(r for r in research_results if r["data"]["type"] == "keyTopics")
-
-        result = {
-            "content": content["data"]["data"],
-            "background": background["data"]["data"],
-            "targetAudience": target_audience["data"]["data"],
-            "keyTopics": key_topics["data"]["data"],
-            "citations": unique_citations
-        }
+def stale_areas(
+    researched_at: Optional[Dict[str, str]],
+    created_at: Optional[str] = None,
+    ttl_days: Optional[Dict[str, float]] = None,
+    now: Optional[float] = None
+) -> Dict[str, float]:
+    """
+    Research areas older than their TTL, mapped to their age in TTLs (1.0 is
+    just expired). Areas researched before per-area timestamps were kept are
+    dated to the row's `created_at`, the earliest they can have been researched
+    (`updated_at` moves with every unrelated edit); with neither they count as
+    infinitely old.
+    """
+    ttl_days = ttl_days or RESEARCH_TTL_DAYS
+    now = time.time() if now is None else now
+    fallback = _timestamp(created_at)
+    stale = {}
+    for area in RESEARCH_AREAS:
+        ttl = ttl_days.get(area["name"])
+        if not ttl:
+            continue
+        stamp = _timestamp((researched_at or {}).get(area["name"])) or fallback
+        age = math.inf if stamp is None else (now - stamp) / (ttl * DAY)
+        if age >= 1:
+            stale[area["name"]] = age
+    return stale
+
+def load_research_areas(journal: WorkJournal, influencer_id: str) -> Dict[str, Dict]:
+    """Areas of an influencer that an earlier attempt or run already paid for."""
+    completed = {}
+    for area in RESEARCH_AREAS:
+        entry = journal.result("research_area", f"{influencer_id}:{area['name']}")
+        if entry is not None:
+            completed[area["name"]] = entry
+    return completed
+
+async def research_influencer(
+    name: str,
+    tiktok_profile_link: str,
+    influencer_id: Optional[str] = None,
+    writer: Optional[BulkUpsertWriter] = None,
+    strategy: str = RESEARCH_STRATEGY,
+    completed: Optional[Dict[str, Dict]] = None,
+    journal: Optional[WorkJournal] = None,
+    existing: Optional[Dict] = None,
+    fresh: bool = False,
+    budget: Optional[RequestBudget] = None,
+    citations: Optional[CitationWriter] = None
+) -> dict:
+    """
+    Research an influencer using the given research strategy and store in Supabase.
+
+    With a `writer` the result is buffered for a bulk upsert keyed on `influencer_id`;
+    otherwise it is written immediately (by id when given, else by name). Areas in
+    `completed` are reused; with a `journal` each new area is persisted as soon as
+    it succeeds. The result is merged per area into the `existing` research.
+    `fresh` and `budget` are passed on to gather_research. Citations go to the
+    citation tables, buffered in `citations` when given.
+    """
+    if not supabase_configured():
+        raise ValueError("Supabase credentials not configured")
+
+    on_section = None
+    if journal is not None and influencer_id:
+        def on_section(area_name: str, entry: Dict) -> None:
+            journal.complete("research_area", f"{influencer_id}:{area_name}", entry)
+
+    try:
+        research = await gather_research(
+            name, tiktok_profile_link, strategy, completed, on_section, fresh, budget
+        )
+        result = merge_research(existing, research["sections"], research["researched_at"])
+        # Sources of a row written before the citation tables move over with it
+        sources = research["citations"] + ((existing or {}).get("citations") or [])
 
         # Update the influencer record in Supabase
-        supabase.table("influencers").update({
-            "influencer_research": result
-        }).eq("name", name).execute()
+        if writer is not None and influencer_id:
+            await writer.add({
+                "id": influencer_id,
+                "name": name,
+                "influencer_research": result
+            })
+            ids = [influencer_id]
+        else:
+            query = get_supabase().table("influencers").update({
+                "influencer_research": result
+            })
+            if influencer_id:
+                query = query.eq("id", influencer_id)
+            else:
+                query = query.eq("name", name)
+            with track("supabase", "update:influencers"):
+                ids = [row["id"] for row in query.execute().data]
+
+        if citations is not None:
+            for updated_id in ids:
+                await citations.add(updated_id, sources)
+        else:
+            async with CitationWriter(get_supabase(), flush_interval=0) as direct:
+                for updated_id in ids:
+                    await direct.add(updated_id, sources)
+
+        if on_section is not None:
+            # The merged result is journaled (or written) now; the areas are no longer needed
+            journal.forget("research_area", [f"{influencer_id}:{area['name']}" for area in RESEARCH_AREAS])
 
         return result
 
@@ -253,65 +610,385 @@ Format your response as JSON:
         print(f"Error researching influencer {name}: {str(e)}")
         raise
 
-async def research_all_influencers():
+async def research_with_retries(
+    influencer: dict,
+    writer: Optional[BulkUpsertWriter] = None,
+    max_retries: int = 3,
+    journal: Optional[WorkJournal] = None,
+    strategy: str = RESEARCH_STRATEGY,
+    areas: Optional[List[str]] = None,
+    budget: Optional[RequestBudget] = None,
+    citations: Optional[CitationWriter] = None,
+    ttl_days: Optional[Dict[str, float]] = None
+) -> bool:
+    """
+    Research one influencer, backing off on rate limits. Returns True on success.
+    Retries only request the areas that failed; the others are kept in memory and,
+    with a `journal`, across runs. With a `journal`, influencers whose research
+    is journaled but not yet written are skipped (replay_journal writes it) and
+    ones leased by another worker are left alone.
+
+    With `areas` only those areas are re-researched, bypassing the response
+    cache, and the rest are kept from the influencer's `influencer_research`;
+    this is how stale research is refreshed, and journaled areas older than
+    `ttl_days` (RESEARCH_TTL_DAYS by default) are not reused. Calls are charged
+    to `budget`; once it is spent BudgetExhausted is raised and the influencer
+    is left, unfailed, for a later run.
+    """
+    completed: Dict[str, Dict] = {}
+    existing = influencer.get('influencer_research')
+    if journal is not None:
+        if journal.is_done("research", influencer['id']):
+            return True
+        if not journal.lease("research", influencer['id']):
+            print(f"Skipping {influencer['name']} - already in progress elsewhere")
+            return False
+        completed = load_research_areas(journal, influencer['id'])
+        if areas is not None:
+            # Journaled areas from before the refresh are as stale as the stored ones
+            fresh_areas = set(completed) - set(stale_areas(
+                {name: entry.get("researchedAt") for name, entry in completed.items()},
+                ttl_days=ttl_days
+            ))
+            completed = {name: entry for name, entry in completed.items() if name in fresh_areas}
+        if completed:
+            print(f"Reusing {len(completed)} researched areas for {influencer['name']}")
+    if areas is not None:
+        for area in RESEARCH_AREAS:
+            if area["name"] not in areas and area["name"] in (existing or {}):
+                completed.setdefault(area["name"], {"data": existing[area["name"]], "citations": []})
+
+    retry_delay = 15  # The shared concurrency limit backs off too, so start small
+
+    for attempt in range(max_retries):
+        try:
+            print(f"Researching {influencer['name']}... (attempt {attempt + 1}/{max_retries})")
+            await research_influencer(
+                name=influencer['name'],
+                tiktok_profile_link=influencer['tiktok_profile_link'],
+                influencer_id=influencer['id'],
+                writer=writer,
+                strategy=strategy,
+                completed=completed,
+                journal=journal,
+                existing=existing,
+                fresh=areas is not None,
+                budget=budget,
+                citations=citations
+            )
+            print(f"Successfully researched {influencer['name']}")
+            return True
+
+        except Exception as e:
+            error_str = str(e)
+            if _budget_exhausted(e):
+                print(f"Request budget spent, leaving {influencer['name']} for a later run")
+                if journal is not None:
+                    journal.release("research", influencer['id'])
+                raise BudgetExhausted(error_str) from e
+            if is_rate_limited(e):
+                if attempt < max_retries - 1:
+                    # The shared concurrency limit already backed off; honour the
+                    # provider's hint when it gives one
+                    delay = retry_after(e) or retry_delay
+                    print(f"Rate limited. Waiting {delay:.0f} seconds before retry...")
+                    record_retry("perplexity", "chat.completions")
+                    await asyncio.sleep(delay)
+                    retry_delay *= 2  # Double the delay for next attempt
+                    continue
+            elif isinstance(e, PartialResearchError) and attempt < max_retries - 1:
+                print(f"Retrying {', '.join(e.errors)} for {influencer['name']}...")
+                record_retry("perplexity", "chat.completions")
+                continue
+
+            print(f"Error researching {influencer['name']}: {error_str}")
+            if journal is not None:
+                journal.fail("research", influencer['id'], error_str)
+            return False
+
+    return False
+
+async def research_all_influencers(
+    concurrency: int = RESEARCH_CONCURRENCY,
+    requests_per_minute: Optional[float] = None,
+    write_batch_size: int = RESEARCH_WRITE_BATCH_SIZE,
+    write_flush_interval: float = RESEARCH_WRITE_FLUSH_INTERVAL,
+    strategy: str = RESEARCH_STRATEGY
+):
     """
     Research all influencers in the Supabase table that don't have research data.
+
+    The backlog is streamed in keyset pages and up to `concurrency` influencers are
+    researched at once by workers pulling from a bounded queue, so a slow or
+    rate-limited influencer never holds up the rest.
+    `requests_per_minute` caps Perplexity calls across all workers. Results are
+    written as bulk upserts of `write_batch_size` rows keyed on the influencer id.
+    `strategy` picks combined or per-area research calls, see gather_research.
     """
-    if not SUPABASE_URL or not SUPABASE_KEY:
+    if not supabase_configured():
         raise ValueError("Supabase credentials not configured")
         
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase = get_supabase()
+
+    if requests_per_minute:
+        configure_limiter("perplexity", requests_per_minute)
     
     try:
-        # Fetch only influencers without research data
-        response = supabase.table("influencers").select(
-            "id, name, tiktok_profile_link, influencer_research"
-        ).is_("influencer_research", "null").execute()
-        
-        influencers = response.data
-        
-        print(f"Found {len(influencers)} influencers that need research")
-        
-        for influencer in influencers:
-            max_retries = 3
-            retry_delay = 60  # Start with 1 minute delay
-            
-            for attempt in range(max_retries):
-                try:
-                    print(f"Researching {influencer['name']}... (attempt {attempt + 1}/{max_retries})")
-                    await research_influencer(
-                        name=influencer['name'],
-                        tiktok_profile_link=influencer['tiktok_profile_link']
-                    )
-                    print(f"Successfully researched {influencer['name']}")
-                    break
-                    
-                except Exception as e:
-                    error_str = str(e)
-                    if "rate limit" in error_str.lower():
-                        if attempt < max_retries - 1:
-                            print(f"Rate limited. Waiting {retry_delay} seconds before retry...")
-                            await asyncio.sleep(retry_delay)
-                            retry_delay *= 2  # Double the delay for next attempt
-                            continue
-                    
-                    print(f"Error researching {influencer['name']}: {error_str}")
-                    break
-            
-            # Optional: Add a small delay between influencers to avoid rate limits
-            await asyncio.sleep(5)
+        # Stream only influencers without research data, page by page
+        influencers = iter_rows(
+            supabase,
+            "influencers",
+            "id, name, tiktok_profile_link",
+            where=lambda query: query.is_("influencer_research", "null")
+        )
+
+        results = {"succeeded": 0, "failed": 0}
+
+        journal = get_work_journal()
+
+        async with BulkUpsertWriter(
+            supabase,
+            "influencers",
+            on_conflict="id",
+            batch_size=write_batch_size,
+            flush_interval=write_flush_interval,
+            journal=journal,
+            journal_stage="research"
+        ) as writer, CitationWriter(supabase, journal=journal) as citations:
+            # Results from a previous run that crashed before flushing
+            await writer.replay_journal()
+            await citations.replay_journal()
+
+            async def research(influencer: dict) -> None:
+                if await research_with_retries(
+                    influencer, writer, journal=journal, strategy=strategy, citations=citations
+                ):
+                    results["succeeded"] += 1
+                else:
+                    results["failed"] += 1
+
+            total = await for_each_row(influencers, research, concurrency)
+            print(f"Processed {total} influencers that needed research")
                 
-        print("Completed researching all influencers")
+        print(f"Completed researching all influencers: {results['succeeded']} succeeded, {results['failed']} failed")
         
     except Exception as e:
         print(f"Error fetching influencers: {str(e)}")
         raise
 
+def request_estimate(areas: int, strategy: str = RESEARCH_STRATEGY) -> int:
+    """Perplexity calls it takes to research `areas` areas when nothing fails."""
+    return 1 if strategy == "combined" and areas > 1 else areas
+
+def refresh_priority(stale: Dict[str, float], selections: int) -> float:
+    """The most overdue area's age in TTLs, weighted up by how often the influencer was picked."""
+    return max(stale.values()) * (1 + math.log1p(selections))
+
+async def plan_refresh(
+    budget: int,
+    strategy: str = RESEARCH_STRATEGY,
+    ttl_days: Optional[Dict[str, float]] = None
+) -> List[Dict]:
+    """
+    Pick the influencers whose research to refresh this run, each with its
+    `stale` areas. The most overdue and most often selected (in research rows)
+    come first, and only as many as the estimated requests fit in `budget`.
+    """
+    supabase = get_supabase()
+    selections: Counter = Counter()
+    async for row in iter_rows(
+        supabase,
+        "research",
+        "id, selected_influencer",
+        where=lambda query: query.not_.is_("selected_influencer", "null")
+    ):
+        selections[row["selected_influencer"]] += 1
+
+    # Every refresh costs at least one request, so only the top `budget` can fit
+    top: List = []
+    found = 0
+    async for row in iter_rows(
+        supabase,
+        "influencers",
+        "id, name, tiktok_profile_link, created_at, researched_at:influencer_research->researchedAt",
+        where=lambda query: query.not_.is_("influencer_research", "null")
+    ):
+        stale = stale_areas(row.get("researched_at"), row.get("created_at"), ttl_days)
+        if not stale:
+            continue
+        found += 1
+        entry = (refresh_priority(stale, selections[row["id"]]), found, {**row, "stale": stale})
+        if len(top) < budget:
+            heapq.heappush(top, entry)
+        elif entry[0] > top[0][0]:
+            heapq.heapreplace(top, entry)
+
+    plan = []
+    remaining = budget
+    for _, _, candidate in sorted(top, reverse=True):
+        cost = request_estimate(len(candidate["stale"]), strategy)
+        if cost <= remaining:
+            plan.append(candidate)
+            remaining -= cost
+    print(f"Found {found} influencers with stale research, refreshing {len(plan)} within {budget} requests")
+    return plan
+
+def _stored_research(influencer_id: str) -> Optional[Dict]:
+    with track("supabase", "select:influencers"):
+        rows = get_supabase().table("influencers").select(
+            "influencer_research"
+        ).eq("id", influencer_id).execute().data
+    return rows[0]["influencer_research"] if rows else None
+
+async def refresh_stale_research(
+    budget: int = REFRESH_REQUEST_BUDGET,
+    concurrency: int = RESEARCH_CONCURRENCY,
+    strategy: str = RESEARCH_STRATEGY,
+    ttl_days: Optional[Dict[str, float]] = None,
+    write_batch_size: int = RESEARCH_WRITE_BATCH_SIZE,
+    write_flush_interval: float = RESEARCH_WRITE_FLUSH_INTERVAL
+):
+    """
+    Re-research only the areas of already researched influencers that are older
+    than their TTL (RESEARCH_TTL_DAYS unless `ttl_days` is given), merging them
+    into the stored research. The run makes at most `budget` Perplexity
+    requests, retries included; see plan_refresh for who goes first.
+    """
+    if not supabase_configured():
+        raise ValueError("Supabase credentials not configured")
+
+    plan = await plan_refresh(budget, strategy, ttl_days)
+    request_budget = RequestBudget(budget)
+    results = {"succeeded": 0, "failed": 0, "skipped": 0}
+    journal = get_work_journal()
+
+    async with BulkUpsertWriter(
+        get_supabase(),
+        "influencers",
+        on_conflict="id",
+        batch_size=write_batch_size,
+        flush_interval=write_flush_interval,
+        journal=journal,
+        journal_stage="research"
+    ) as writer, CitationWriter(get_supabase(), journal=journal) as citations:
+        await writer.replay_journal()
+        await citations.replay_journal()
+
+        async def planned() -> AsyncIterator[Dict]:
+            for candidate in plan:
+                yield candidate
+
+        async def refresh(candidate: Dict) -> None:
+            if request_budget.remaining == 0:
+                results["skipped"] += 1
+                return
+            influencer = {**candidate, "influencer_research": await asyncio.to_thread(_stored_research, candidate["id"])}
+            print(f"Refreshing {', '.join(candidate['stale'])} for {candidate['name']}")
+            try:
+                refreshed = await research_with_retries(
+                    influencer,
+                    writer,
+                    journal=journal,
+                    strategy=strategy,
+                    areas=list(candidate["stale"]),
+                    budget=request_budget,
+                    citations=citations,
+                    ttl_days=ttl_days
+                )
+            except BudgetExhausted:
+                results["skipped"] += 1
+                return
+            if refreshed:
+                results["succeeded"] += 1
+            else:
+                results["failed"] += 1
+
+        await for_each_row(planned(), refresh, concurrency)
+
+    print(f"Completed refresh: {results['succeeded']} refreshed, {results['failed']} failed, "
+          f"{results['skipped']} skipped, {request_budget.spent}/{budget} requests used")
+
+async def compare_research_strategies(sample_size: int = 5, strategies: Optional[List[str]] = None) -> Dict:
+    """
+    Research a sample of influencers with each strategy, without caching or
+    writing anything, and compare wall time, requests, tokens and how complete
+    the resulting sections are.
+    """
+    if not supabase_configured():
+        raise ValueError("Supabase credentials not configured")
+
+    influencers = get_supabase().table("influencers").select(
+        "id, name, tiktok_profile_link"
+    ).limit(sample_size).execute().data
+
+    cache = get_response_cache()
+    bypass = cache.bypass
+    cache.bypass = True
+    report = {}
+    try:
+        for strategy in strategies or ["fanout", "combined"]:
+            totals = {"influencers": 0, "failed": 0, "seconds": 0.0, "requests": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0, "completeness": 0.0}
+            for influencer in influencers:
+                started = time.perf_counter()
+                try:
+                    research = await gather_research(influencer["name"], influencer["tiktok_profile_link"], strategy)
+                except Exception as e:
+                    print(f"[{strategy}] Error researching {influencer['name']}: {str(e)}")
+                    totals["failed"] += 1
+                    continue
+                totals["seconds"] += time.perf_counter() - started
+                totals["influencers"] += 1
+                for key in ("requests", "prompt_tokens", "completion_tokens"):
+                    totals[key] += research["usage"][key]
+                totals["completeness"] += sum(
+                    section_completeness(area, research["sections"].get(area["name"]))
+                    for area in RESEARCH_AREAS
+                ) / len(RESEARCH_AREAS)
+
+            done = max(1, totals["influencers"])
+            report[strategy] = {
+                "influencers": totals["influencers"],
+                "failed": totals["failed"],
+                "seconds_per_influencer": round(totals["seconds"] / done, 3),
+                "requests_per_influencer": round(totals["requests"] / done, 2),
+                "tokens_per_influencer": round((totals["prompt_tokens"] + totals["completion_tokens"]) / done, 1),
+                "completeness": round(totals["completeness"] / done, 3),
+            }
+            print(f"[{strategy}] {report[strategy]}")
+    finally:
+        cache.bypass = bypass
+    return report
+
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Research influencers that have no research yet.")
+    parser.add_argument("--strategy", choices=["combined", "fanout"], default=RESEARCH_STRATEGY)
+    parser.add_argument("--compare-strategies", type=int, metavar="N",
+                        help="compare both strategies on N influencers instead of researching")
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-research areas older than their TTL instead of researching new influencers")
+    parser.add_argument("--budget", type=int, default=REFRESH_REQUEST_BUDGET,
+                        help="maximum Perplexity requests for a --refresh run")
+    parser.add_argument("--ttl", action="append", default=[], metavar="AREA=DAYS",
+                        help="override an area's TTL for --refresh, e.g. content=7")
+    args = parser.parse_args()
+
     async def main():
+        start_run()
         try:
-            await research_all_influencers()
+            if args.compare_strategies:
+                print(json.dumps(await compare_research_strategies(args.compare_strategies), indent=2))
+            elif args.refresh:
+                ttl_days = {**RESEARCH_TTL_DAYS, **parse_ttls(",".join(args.ttl))}
+                await refresh_stale_research(args.budget, strategy=args.strategy, ttl_days=ttl_days)
+            else:
+                await research_all_influencers(strategy=args.strategy)
         except Exception as e:
             print(f"Error: {str(e)}")
+        finally:
+            await close_async_clients()
+            finish_run()
 
     asyncio.run(main())
@@ -1,20 +1,38 @@
-from supabase import create_client
-from openai import OpenAI
 import os
+import asyncio
+from collections import Counter
 from dotenv import load_dotenv
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from pydantic import BaseModel
-from multiprocessing import Pool, cpu_count
-from functools import partial
+from response_cache import get_response_cache
+from image_store import prepare_image, IMAGE_DETAIL
+from work_journal import WorkJournal, get_work_journal
+from metrics import track, start_run, finish_run, get_metrics
+from clients import get_supabase, get_openai
+from avatar_descriptions import get_image_description
+from rate_limit import get_concurrency
+from supabase_reader import iter_rows, iter_rows_sync, for_each_row
+from avatar_index import AvatarIndex, build_avatar_index, embed_texts, infer_gender
 
 load_dotenv()
 
-# Initialize clients
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+MATCH_MODEL = "gpt-4o-mini"
+MATCH_CONCURRENCY = int(os.getenv("MATCH_CONCURRENCY", "8"))  # Influencers in flight
+MATCH_SHORTLIST_K = int(os.getenv("MATCH_SHORTLIST_K", "10"))  # Avatars sent to the vision model, 0 = all
+# "vision" always asks the vision model; "cascade" accepts a confident embedding
+# match and only asks it otherwise; "shadow" asks it every time but also scores
+# the embedding tier, reporting how often a match the cascade would have
+# accepted agrees with the vision model. Tune the thresholds below with shadow
+# runs before switching to cascade.
+MATCH_MODE = os.getenv("MATCH_MODE", "vision")
+MATCH_ACCEPT_SCORE = float(os.getenv("MATCH_ACCEPT_SCORE", "0.55"))  # Min cosine similarity of the best avatar
+MATCH_MIN_MARGIN = float(os.getenv("MATCH_MIN_MARGIN", "0.03"))  # Min lead of the best avatar over the runner-up
+EMBEDDING_TIER_MODES = ("cascade", "shadow")
+
+# Why influencers were escalated to the vision model this run
+escalations: Counter = Counter()
+# Shadow mode: whether confident embedding matches agreed with the vision model
+agreement: Counter = Counter()
 
 class AvatarMatch(BaseModel):
     reasoning: str
@@ -23,62 +41,136 @@ class AvatarMatch(BaseModel):
 
 def get_all_avatars() -> List[Dict]:
     """Fetch all avatars and their descriptions from Supabase."""
-    response = supabase.table("avatars").select("avatar_id, description").execute()
-    return response.data
-
-def get_influencers_without_avatars() -> List[Dict]:
-    """Fetch influencers that don't have an avatar assigned yet."""
-    response = supabase.table("influencers")\
-        .select("id, image_url")\
-        .is_("avatar_id", "null")\
-        .execute()
-    return response.data
-
-def process_single_influencer(influencer: Dict, avatars: List[Dict]) -> Optional[Dict]:
-    """Process a single influencer and return the result."""
+    return list(iter_rows_sync(get_supabase(), "avatars", "avatar_id, description, gender", key="avatar_id"))
+
+def get_influencers_without_avatars() -> AsyncIterator[Dict]:
+    """Stream influencers that don't have an avatar assigned yet."""
+    return iter_rows(
+        get_supabase(),
+        "influencers",
+        "id, image_url",
+        where=lambda query: query.is_("avatar_id", "null")
+    )
+
+def needs_avatar_index(avatars: List[Dict]) -> bool:
+    """Whether matching uses the embedding index: for the cascade, or to shortlist a big catalog."""
+    return MATCH_MODE in EMBEDDING_TIER_MODES or (MATCH_SHORTLIST_K > 0 and len(avatars) > MATCH_SHORTLIST_K)
+
+async def rank_avatars(influencer: Dict, index: AvatarIndex, k: int = MATCH_SHORTLIST_K) -> List[Dict]:
+    """
+    The k avatars whose descriptions are closest to a short text description
+    of the influencer's image, best first with their scores. Empty if the
+    influencer can't be described or no avatar is indexed yet.
+    """
+    if not len(index):
+        return []
+    description = await asyncio.to_thread(get_image_description, influencer['image_url'])
+    if not description:
+        return []
+    query = await embed_texts(get_openai(), [description])
+    return index.search(query[0], k, gender=infer_gender(description))
+
+def escalation_reason(hits: List[Dict]) -> Optional[str]:
+    """Why an embedding ranking isn't trusted on its own, or None if it is."""
+    if not hits:
+        return "no_description"
+    if len(hits) < 2:
+        # Without a runner-up (e.g. the gender filter left one avatar) there is no margin to judge
+        return "single_candidate"
+    if hits[0]['score'] < MATCH_ACCEPT_SCORE:
+        return "low_score"
+    if hits[0]['score'] - hits[1]['score'] < MATCH_MIN_MARGIN:
+        return "close_margin"
+    return None
+
+def cascade_report() -> Dict:
+    """
+    Influencers resolved per tier, the escalation rate, each tier's latency and,
+    after a shadow run, how often confident embedding matches agreed with vision.
+    """
+    calls = get_metrics().summary()["calls"]
+    tiers = {
+        tier: {
+            "calls": stats["calls"],
+            "latency_p50": stats["latency_p50"],
+            "latency_p95": stats["latency_p95"],
+        }
+        for tier, stats in ((key.split(":", 1)[1], stats) for key, stats in calls.items() if key.startswith("cascade:"))
+    }
+    first = tiers.get("embedding", {}).get("calls", 0)
+    escalated = sum(escalations.values())
+    compared = agreement["agree"] + agreement["disagree"]
+    return {
+        "tiers": tiers,
+        "escalation_rate": escalated / first if first else None,
+        "escalations": dict(escalations),
+        "agreement_rate": agreement["agree"] / compared if compared else None,
+        "compared": compared,
+    }
+
+def print_cascade_report() -> None:
+    report = cascade_report()
+    if not report["tiers"]:
+        return
+    def fmt(value):
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+    for tier, stats in report["tiers"].items():
+        print(f"Tier {tier:10} n={stats['calls']:<6} p50={fmt(stats['latency_p50'])} p95={fmt(stats['latency_p95'])}")
+    if report["escalation_rate"] is not None:
+        reasons = ", ".join(f"{reason}={count}" for reason, count in sorted(report["escalations"].items()))
+        print(f"Escalated to vision: {report['escalation_rate']:.1%} ({reasons or 'none'})")
+    if report["agreement_rate"] is not None:
+        print(f"Confident embedding matches agreeing with vision: {report['agreement_rate']:.1%} "
+              f"of {report['compared']}")
+
+async def process_single_influencer(
+    influencer: Dict,
+    avatars: List[Dict],
+    index: Optional[AvatarIndex] = None,
+    mode: str = MATCH_MODE
+) -> Optional[Dict]:
+    """
+    Process a single influencer and return the result. With an `index`, the
+    avatars are first ranked by description embeddings. In "cascade" mode a
+    confident ranking is the answer; otherwise only the shortlisted avatars are
+    put in the vision prompt. In "shadow" mode the vision model always decides
+    and a confident ranking is only compared with it. The result names the
+    `tier` that decided it.
+    """
     print(f"Processing influencer {influencer['id']}...")
     
     try:
-        # Create new OpenAI client for each process
-        process_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        avatar_descriptions = "\n".join([
-            f"Avatar {avatar['avatar_id']}: {avatar['description']}"
-            for avatar in avatars
-        ])
-        
-        prompt = f"""Given the image of this person, analyze their appearance and match them with the most suitable avatar from the following descriptions. Consider facial features, overall appearance, and style:
+        shortlist = index is not None and len(index) > MATCH_SHORTLIST_K > 0
+        confident = None
+        if index is not None and (mode in EMBEDDING_TIER_MODES or shortlist):
+            with track("cascade", "embedding"):
+                hits = await rank_avatars(influencer, index, max(MATCH_SHORTLIST_K, 2))
+            if mode in EMBEDDING_TIER_MODES:
+                reason = escalation_reason(hits)
+                if reason is not None:
+                    escalations[reason] += 1
+                elif mode == "shadow":
+                    confident = hits[0]['avatar_id']
+                else:
+                    print(f"Influencer {influencer['id']} - Embedding match score: {hits[0]['score']:.3f}")
+                    return {
+                        'influencer_id': influencer['id'],
+                        'avatar_id': hits[0]['avatar_id'],
+                        'tier': 'embedding',
+                        'success': True
+                    }
+            if shortlist:
+                avatars_by_id = {avatar['avatar_id']: avatar for avatar in avatars}
+                shortlisted = [avatars_by_id[hit['avatar_id']] for hit in hits if hit['avatar_id'] in avatars_by_id]
+                # Nothing ranked (no description, or the gender filter removed
+                # every avatar): let the vision model see the whole catalog
+                avatars = shortlisted or avatars
 
-{avatar_descriptions}"""
-
-        response = process_client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": influencer['image_url']}
-                        }
-                    ]
-                }
-            ],
-            response_format=AvatarMatch,
-            max_tokens=1000,
-            temperature=0.2
-        )
-        
-        match_result = response.choices[0].message.parsed
-        print(f"Influencer {influencer['id']} - Match confidence: {match_result.confidence_score}")
-        print(f"Influencer {influencer['id']} - Reasoning: {match_result.reasoning}")
-        
-        return {
-            'influencer_id': influencer['id'],
-            'avatar_id': match_result.best_match_avatar_id,
-            'success': True
-        }
+        with track("cascade", "vision"):
+            result = await match_with_vision(influencer, avatars)
+        if confident is not None:
+            agreement["agree" if result['avatar_id'] == confident else "disagree"] += 1
+        return result
     except Exception as e:
         print(f"Error processing influencer {influencer['id']}: {e}")
         return {
@@ -87,58 +179,173 @@ def process_single_influencer(influencer: Dict, avatars: List[Dict]) -> Optional
             'error': str(e)
         }
 
+async def match_with_vision(influencer: Dict, avatars: List[Dict]) -> Dict:
+    """Ask the vision model which of `avatars` best matches the influencer's image."""
+    avatar_descriptions = "\n".join([
+        f"Avatar {avatar['avatar_id']}: {avatar['description']}"
+        for avatar in avatars
+    ])
+
+    prompt = f"""Given the image of this person, analyze their appearance and match them with the most suitable avatar from the following descriptions. Consider facial features, overall appearance, and style:
+
+{avatar_descriptions}"""
+
+    image_data_url, image_key = await asyncio.to_thread(prepare_image, influencer['image_url'])
+
+    cache = get_response_cache()
+    cache_key = cache.make_key("openai", MATCH_MODEL, prompt, image_key, temperature=0.2, max_tokens=1000)
+    hit, cached = cache.get(cache_key)
+    if hit and cached:
+        print(f"Influencer {influencer['id']} - Using cached match")
+        return {
+            'influencer_id': influencer['id'],
+            'avatar_id': cached['best_match_avatar_id'],
+            'tier': 'vision',
+            'success': True
+        }
+
+    async with get_concurrency("openai").slot():
+        with track("openai", "chat.completions.parse") as call:
+            response = await get_openai().beta.chat.completions.parse(
+                model=MATCH_MODEL,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": image_data_url, "detail": IMAGE_DETAIL}
+                            }
+                        ]
+                    }
+                ],
+                response_format=AvatarMatch,
+                max_tokens=1000,
+                temperature=0.2
+            )
+            call.usage(response.usage)
+
+    match_result = response.choices[0].message.parsed
+    cache.set(cache_key, match_result.model_dump())
+    print(f"Influencer {influencer['id']} - Match confidence: {match_result.confidence_score}")
+    print(f"Influencer {influencer['id']} - Reasoning: {match_result.reasoning}")
+
+    return {
+        'influencer_id': influencer['id'],
+        'avatar_id': match_result.best_match_avatar_id,
+        'tier': 'vision',
+        'success': True
+    }
+
 def update_influencer_avatar(influencer_id: str, avatar_id: str):
     """Update the avatar_id for an influencer in Supabase."""
-    # Create new Supabase client for thread safety
-    process_supabase = create_client(
-        os.getenv("SUPABASE_URL"),
-        os.getenv("SUPABASE_SERVICE_KEY")
-    )
-    process_supabase.table("influencers")\
-        .update({"avatar_id": avatar_id})\
-        .eq("id", influencer_id)\
-        .execute()
+    with track("supabase", "update:influencers"):
+        get_supabase().table("influencers")\
+            .update({"avatar_id": avatar_id})\
+            .eq("id", influencer_id)\
+            .execute()
+
+async def match_and_store(
+    influencer: Dict,
+    avatars: List[Dict],
+    index: Optional[AvatarIndex] = None,
+    journal: Optional[WorkJournal] = None
+) -> Dict:
+    """
+    Match one influencer and write the avatar to Supabase. With a `journal`, the
+    match is recorded before the write so it survives a crash in between, and
+    influencers matched but not yet written (replay_avatar_matches does that)
+    or leased elsewhere are skipped.
+    """
+    if journal is not None:
+        if journal.is_done("avatar", influencer['id']):
+            return {'influencer_id': influencer['id'], 'success': True, 'skipped': True}
+        if not journal.lease("avatar", influencer['id']):
+            return {'influencer_id': influencer['id'], 'success': False, 'error': 'leased by another worker'}
+
+    result = await process_single_influencer(influencer, avatars, index)
+    if not result['success']:
+        if journal is not None:
+            journal.fail("avatar", influencer['id'], result.get('error', 'Unknown error'))
+        return result
+
+    if journal is not None:
+        journal.complete("avatar", influencer['id'], {'avatar_id': result['avatar_id']})
+    await asyncio.to_thread(update_influencer_avatar, result['influencer_id'], result['avatar_id'])
+    if journal is not None:
+        journal.mark_written("avatar", [influencer['id']])
+    return result
+
+async def replay_avatar_matches(journal: WorkJournal) -> int:
+    """Write matches that were journaled but never reached Supabase."""
+    pending = journal.unwritten("avatar")
+    for influencer_id, payload in pending:
+        try:
+            await asyncio.to_thread(update_influencer_avatar, influencer_id, payload['avatar_id'])
+            journal.mark_written("avatar", [influencer_id])
+        except Exception as e:
+            print(f"Error replaying avatar for influencer {influencer_id}: {str(e)}")
+    if pending:
+        print(f"Replayed {len(pending)} unwritten avatar matches")
+    return len(pending)
+
+async def match_all_influencers(concurrency: int = MATCH_CONCURRENCY):
+    """
+    Match every influencer without an avatar, `concurrency` at a time. Each match is
+    journaled and written to Supabase as soon as it arrives, so a crash only loses
+    in-flight work and a rerun replays anything left unwritten.
+    """
+    journal = get_work_journal()
+    await replay_avatar_matches(journal)
 
-def main():
     # Get all avatars and their descriptions
     avatars = get_all_avatars()
     if not avatars:
         print("No avatars found in the database")
         return
 
-    # Get influencers without avatars
-    influencers = get_influencers_without_avatars()
-    if not influencers:
-        print("No influencers found without avatars")
-        return
-
-    # Determine number of processes (use 75% of available CPUs)
-    num_processes = 8
-    print(f"Processing with {num_processes} processes...")
+    index = None
+    if needs_avatar_index(avatars):
+        index = await build_avatar_index(get_openai(), avatars)
 
-    # Create a partial function with the avatars parameter fixed
-    process_func = partial(process_single_influencer, avatars=avatars)
+    print(f"Processing influencers without avatars with concurrency {concurrency}...")
 
-    # Process influencers in parallel
-    with Pool(num_processes) as pool:
-        results = pool.map(process_func, influencers)
-
-    # Process results and update database
     successful = 0
     failed = 0
-    
-    for result in results:
-        if result['success']:
-            update_influencer_avatar(result['influencer_id'], result['avatar_id'])
-            successful += 1
-            print(f"Updated influencer {result['influencer_id']} with avatar {result['avatar_id']}")
-        else:
+
+    async def match(influencer: Dict) -> None:
+        nonlocal successful, failed
+        try:
+            result = await match_and_store(influencer, avatars, index, journal)
+        except Exception as e:
+            failed += 1
+            print(f"Error updating influencer {influencer['id']}: {str(e)}")
+            return
+
+        if not result['success']:
             failed += 1
             print(f"Failed to process influencer {result['influencer_id']}: {result.get('error', 'Unknown error')}")
+        elif not result.get('skipped'):
+            successful += 1
+            print(f"Updated influencer {result['influencer_id']} with avatar {result['avatar_id']} ({result['tier']} tier)")
+
+    total = await for_each_row(get_influencers_without_avatars(), match, concurrency)
+    if not total:
+        print("No influencers found without avatars")
+        return
 
     print(f"\nProcessing complete:")
     print(f"Successfully processed: {successful}")
     print(f"Failed to process: {failed}")
+    print_cascade_report()
+
+def main():
+    start_run()
+    try:
+        asyncio.run(match_all_influencers())
+    finally:
+        finish_run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+MAX_SAMPLES = 10000  # Latency samples kept per call type for percentiles
+
+METRICS_SUMMARY_PATH = os.getenv("METRICS_SUMMARY_PATH")
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+@dataclass
+class CallRecord:
+    """Filled in by the caller while a tracked call runs."""
+    status_code: Optional[int] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    error: bool = False
+
+    def usage(self, usage) -> None:
+        """Copy token counts from an OpenAI-style `usage` object or dict."""
+        if usage is None:
+            return
+        get = usage.get if isinstance(usage, dict) else lambda key, default=0: getattr(usage, key, default)
+        self.prompt_tokens += get("prompt_tokens", 0) or 0
+        self.completion_tokens += get("completion_tokens", 0) or 0
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    latency_sum: float = 0.0
+    buckets: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    samples: List[float] = field(default_factory=list)
+    status_codes: Dict[str, int] = field(default_factory=dict)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def observe(self, latency: float, call: CallRecord) -> None:
+        self.calls += 1
+        self.errors += int(call.error)
+        self.latency_sum += latency
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+        self.buckets[bucket] += 1
+        # Reservoir sampling keeps percentiles representative on long runs
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(latency)
+        else:
+            slot = random.randrange(self.calls)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = latency
+        if call.status_code is not None:
+            key = str(call.status_code)
+            self.status_codes[key] = self.status_codes.get(key, 0) + 1
+        self.prompt_tokens += call.prompt_tokens
+        self.completion_tokens += call.completion_tokens
+        self.bytes_sent += call.bytes_sent
+        self.bytes_received += call.bytes_received
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "latency_avg": self.latency_sum / self.calls if self.calls else None,
+            "latency_p50": self.percentile(0.50),
+            "latency_p95": self.percentile(0.95),
+            "latency_p99": self.percentile(0.99),
+            "status_codes": dict(self.status_codes),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+class Metrics:
+    """Thread-safe per-(provider, operation) call statistics for one process."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._stats: Dict[Tuple[str, str], CallStats] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider: str, operation: str) -> CallStats:
+        key = (provider, operation)
+        if key not in self._stats:
+            self._stats[key] = CallStats()
+        return self._stats[key]
+
+    def record(self, provider: str, operation: str, latency: float, call: CallRecord) -> None:
+        with self._lock:
+            self._get(provider, operation).observe(latency, call)
+
+    def record_retry(self, provider: str, operation: str) -> None:
+        with self._lock:
+            self._get(provider, operation).retries += 1
+
+    @contextmanager
+    def track(self, provider: str, operation: str) -> Iterator[CallRecord]:
+        """Time one external call; the yielded record takes status, tokens and bytes."""
+        call = CallRecord()
+        started = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            call.error = True
+            raise
+        finally:
+            if call.status_code is not None and call.status_code >= 400:
+                call.error = True
+            self.record(provider, operation, time.perf_counter() - started, call)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            calls = {
+                f"{provider}:{operation}": stats.to_dict()
+                for (provider, operation), stats in sorted(self._stats.items())
+            }
+        return {"elapsed_seconds": time.time() - self.started, "calls": calls}
+
+    def write_summary(self, path: Optional[str] = METRICS_SUMMARY_PATH) -> None:
+        """Write the JSON summary to `path`, or to stdout when no path is set."""
+        payload = json.dumps(self.summary(), indent=2)
+        if path:
+            with open(path, "w") as f:
+                f.write(payload)
+            print(f"Metrics summary written to {path}")
+        else:
+            print(payload, file=sys.stdout)
+
+    def prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# TYPE external_call_latency_seconds histogram",
+            "# TYPE external_call_errors_total counter",
+            "# TYPE external_call_retries_total counter",
+            "# TYPE external_call_status_total counter",
+            "# TYPE external_call_tokens_total counter",
+            "# TYPE external_call_bytes_total counter",
+        ]
+        with self._lock:
+            for (provider, operation), stats in sorted(self._stats.items()):
+                labels = f'provider="{provider}",operation="{operation}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'external_call_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'external_call_latency_seconds_bucket{{{labels},le="+Inf"}} {stats.calls}')
+                lines.append(f"external_call_latency_seconds_sum{{{labels}}} {stats.latency_sum}")
+                lines.append(f"external_call_latency_seconds_count{{{labels}}} {stats.calls}")
+                lines.append(f"external_call_errors_total{{{labels}}} {stats.errors}")
+                lines.append(f"external_call_retries_total{{{labels}}} {stats.retries}")
+                for code, count in sorted(stats.status_codes.items()):
+                    lines.append(f'external_call_status_total{{{labels},code="{code}"}} {count}')
+                lines.append(f'external_call_tokens_total{{{labels},kind="prompt"}} {stats.prompt_tokens}')
+                lines.append(f'external_call_tokens_total{{{labels},kind="completion"}} {stats.completion_tokens}')
+                lines.append(f'external_call_bytes_total{{{labels},direction="sent"}} {stats.bytes_sent}')
+                lines.append(f'external_call_bytes_total{{{labels},direction="received"}} {stats.bytes_received}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int) -> "ThreadingHTTPServer":
+        """Serve /metrics in Prometheus format from a daemon thread."""
+        # http.server pulls in most of the email package; only load it when serving
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving Prometheus metrics on :{port}/metrics")
+        return server
+
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    """Process-wide metrics registry."""
+    return _metrics
+
+def track(provider: str, operation: str):
+    return _metrics.track(provider, operation)
+
+def record_retry(provider: str, operation: str) -> None:
+    _metrics.record_retry(provider, operation)
+
+def start_run() -> None:
+    """Start the Prometheus endpoint if METRICS_PORT is set."""
+    if METRICS_PORT:
+        _metrics.serve(int(METRICS_PORT))
+
+def finish_run() -> None:
+    """Emit the end-of-run JSON summary."""
+    _metrics.write_summary()
@@ -0,0 +1,492 @@
+import io
+import re
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+@dataclass
+class ProviderProfile:
+    """
+    Behaviour of one mocked provider: log-normal latency around `median_ms`,
+    a share of requests answered with 429, and the approximate response size.
+    """
+    median_ms: float = 50.0
+    sigma: float = 0.5
+    error_rate: float = 0.0
+    payload_bytes: int = 0
+
+    def delay(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms / 1000.0 * math.exp(rng.gauss(0, self.sigma))
+
+DEFAULT_PROFILES = {
+    "perplexity": ProviderProfile(median_ms=800, sigma=0.4, payload_bytes=2000),
+    "openai": ProviderProfile(median_ms=600, sigma=0.4),
+    "groq": ProviderProfile(median_ms=300, sigma=0.4),
+    "brave": ProviderProfile(median_ms=150, sigma=0.3),
+    "heygen": ProviderProfile(median_ms=300, sigma=0.3),
+    "images": ProviderProfile(median_ms=40, sigma=0.3, payload_bytes=1024),
+    "supabase": ProviderProfile(median_ms=20, sigma=0.3),
+}
+
+EMBEDDING_DIM = 64
+
+def _filler(size: int) -> str:
+    words = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+    out, length, i = [], 0, 0
+    while length < size:
+        out.append(words[i % len(words)])
+        length += len(out[-1]) + 1
+        i += 1
+    return " ".join(out)
+
+def _embedding(text: str) -> List[float]:
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.gauss(0, 1) for _ in range(EMBEDDING_DIM)]
+
+def _json_from_template(prompt: str, payload_bytes: int) -> Dict:
+    """
+    Fill the `"field": string | string[]` JSON template found in a research
+    prompt, including templates with nested `"section": { ... }` objects.
+    """
+    tokens = re.findall(r'"(\w+)":\s*(string\[\]|string|\{)|(\})', prompt)
+    fields = sum(1 for _, kind, _ in tokens if kind.startswith("string"))
+    per_field = max(16, payload_bytes // max(1, fields))
+    root: Dict = {}
+    stack = [root]
+    for name, kind, close in tokens:
+        if close:
+            if len(stack) > 1:
+                stack.pop()
+        elif kind == "{":
+            stack[-1][name] = {}
+            stack.append(stack[-1][name])
+        elif kind == "string[]":
+            stack[-1][name] = [_filler(per_field // 3) for _ in range(3)]
+        else:
+            stack[-1][name] = _filler(per_field)
+    return root
+
+class MockDatabase:
+    """In-memory stand-in for the PostgREST tables the scripts touch."""
+
+    PRIMARY_KEYS = {"influencers": "id", "avatars": "avatar_id"}
+
+    def __init__(self):
+        self.tables: Dict[str, Dict[str, Dict]] = {}
+        self.lock = threading.Lock()
+
+    def table(self, name: str) -> Dict[str, Dict]:
+        return self.tables.setdefault(name, {})
+
+    def key_of(self, table: str, row: Dict) -> str:
+        column = self.PRIMARY_KEYS.get(table, "id")
+        if column not in row:
+            row[column] = str(uuid.uuid4())
+        return str(row[column])
+
+    def seed(self, table: str, rows: List[Dict]) -> None:
+        with self.lock:
+            for row in rows:
+                self.table(table)[self.key_of(table, row)] = dict(row)
+
+def _matches(row: Dict, column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, value = expression.partition(".")
+    current = row.get(column)
+    if op == "is":
+        result = current is None if value == "null" else str(current).lower() == value
+    elif op == "eq":
+        result = current is not None and str(current) == value
+    elif op == "neq":
+        result = current is not None and str(current) != value
+    elif op in ("gt", "gte", "lt", "lte"):
+        if current is None:
+            result = False
+        else:
+            a, b = str(current), value
+            result = {"gt": a > b, "gte": a >= b, "lt": a < b, "lte": a <= b}[op]
+    elif op == "in":
+        result = str(current) in [v.strip('"') for v in value.strip("()").split(",")]
+    else:
+        result = True
+    return not result if negate else result
+
+def _matches_or(row: Dict, expression: str) -> bool:
+    for part in expression.strip("()").split(","):
+        column, _, rest = part.partition(".")
+        if _matches(row, column, rest):
+            return True
+    return False
+
+def _project(row: Dict, column: str) -> Tuple[str, object]:
+    """Resolve one PostgREST select item: `alias:column->key->>key` or a plain column."""
+    alias, _, path = column.rpartition(":")
+    parts = re.split(r"->>?", path)
+    value = row.get(parts[0])
+    for key in parts[1:]:
+        value = value.get(key) if isinstance(value, dict) else None
+    if value is not None and "->>" in path and not isinstance(value, str):
+        value = json.dumps(value)
+    return alias or parts[-1], value
+
+class MockProviders:
+    """
+    One local HTTP server that impersonates Perplexity, OpenAI, Groq, Brave,
+    HeyGen, an image CDN and Supabase PostgREST under different path prefixes.
+    Point the scripts at it with the environment from `env()`.
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, ProviderProfile]] = None, seed: int = 0, brave_rate: int = 1000):
+        self.profiles = {**DEFAULT_PROFILES, **(profiles or {})}
+        self.db = MockDatabase()
+        self.brave_rate = brave_rate
+        self.requests: Dict[str, int] = {}
+        self._requests_lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._image_cache: Dict[int, bytes] = {}
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> Dict[str, str]:
+        base = self.base_url
+        fake_key = "bench.bench.bench"
+        return {
+            "SUPABASE_URL": f"{base}/supabase",
+            "NEXT_PUBLIC_SUPABASE_URL": f"{base}/supabase",
+            "SUPABASE_SERVICE_KEY": fake_key,
+            "SUPABASE_SERVICE_ROLE_KEY": fake_key,
+            "PERPLEXITY_API_URL": f"{base}/perplexity/chat/completions",
+            "PERPLEXITY_API_KEY": "bench",
+            "OPENAI_BASE_URL": f"{base}/openai/v1",
+            "OPENAI_API_KEY": "bench",
+            "GROQ_BASE_URL": f"{base}/groq",
+            "GROQ_API_KEY": "bench",
+            "BRAVE_SEARCH_URL": f"{base}/brave/res/v1/images/search",
+            "BRAVE_API_KEY": "bench",
+            "HEYGEN_AVATARS_URL": f"{base}/heygen/v2/avatars",
+            "HEYGEN_API_KEY": "bench",
+        }
+
+    def seed(self, influencers: int, avatars: int) -> None:
+        """Populate the mock database and HeyGen catalog."""
+        self.db.seed("influencers", [
+            {
+                "id": str(uuid.UUID(int=i + 1)),
+                "name": f"Creator {i}",
+                "tiktok_handle": f"creator{i}",
+                "tiktok_profile_link": f"https://www.tiktok.com/@creator{i}",
+                "category": None,
+                "image_url": None,
+                "influencer_research": None,
+                "avatar_id": None,
+                "created_at": "2025-01-01T00:00:00+00:00",
+                "updated_at": "2025-01-01T00:00:00+00:00",
+            }
+            for i in range(influencers)
+        ])
+        self.heygen_avatars = [
+            {
+                "avatar_id": f"avatar_{i}",
+                "avatar_name": f"Person{i} Casual",
+                "gender": "female" if i % 2 else "male",
+                "preview_image_url": f"{self.base_url}/images/avatar_{i}.jpg",
+            }
+            for i in range(avatars)
+        ]
+
+    # -- server plumbing -------------------------------------------------
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "MockProviders":
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def do_GET(self):
+                mock._dispatch(self, "GET", b"")
+
+            def do_POST(self):
+                mock._dispatch(self, "POST", self._body())
+
+            def do_PATCH(self):
+                mock._dispatch(self, "PATCH", self._body())
+
+            def do_DELETE(self):
+                mock._dispatch(self, "DELETE", self._body())
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def _random(self) -> Tuple[float, float]:
+        with self._rng_lock:
+            return self._rng.random(), self._rng.gauss(0, 1)
+
+    def _delay(self, profile: ProviderProfile) -> float:
+        with self._rng_lock:
+            return profile.delay(self._rng)
+
+    def _send(self, handler: BaseHTTPRequestHandler, status: int, body, content_type: str = "application/json", headers: Optional[Dict] = None):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, str(value))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _dispatch(self, handler: BaseHTTPRequestHandler, method: str, body: bytes):
+        parsed = urlparse(handler.path)
+        provider = parsed.path.strip("/").split("/", 1)[0]
+        profile = self.profiles.get(provider, ProviderProfile(median_ms=0))
+        with self._requests_lock:
+            self.requests[provider] = self.requests.get(provider, 0) + 1
+
+        time.sleep(self._delay(profile))
+        roll, _ = self._random()
+        if roll < profile.error_rate:
+            self._send(handler, 429, {"error": {"message": "rate limit exceeded (mock)"}}, headers={"Retry-After": 1})
+            return
+
+        try:
+            route = getattr(self, f"_{provider}", None)
+            if route is None:
+                self._send(handler, 404, {"error": f"unknown provider {provider}"})
+                return
+            route(handler, method, parsed, body, profile)
+        except Exception as e:
+            self._send(handler, 500, {"error": str(e)})
+
+    # -- providers ---------------------------------------------------------
+
+    @staticmethod
+    def _completion(content: str, prompt: str, extra: Optional[Dict] = None) -> Dict:
+        response = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "mock",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        }
+        response.update(extra or {})
+        return response
+
+    @staticmethod
+    def _prompt_text(request: Dict) -> str:
+        parts = []
+        for message in request.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, str):
+                parts.append(content)
+            elif isinstance(content, list):
+                parts.extend(item.get("text", "") for item in content if item.get("type") == "text")
+        return "\n".join(parts)
+
+    def _perplexity(self, handler, method, parsed, body, profile):
+        request = json.loads(body or b"{}")
+        prompt = self._prompt_text(request)
+        content = json.dumps(_json_from_template(prompt, profile.payload_bytes))
+        citations = [f"https://example.com/source/{i}?utm_source=mock" for i in range(5)]
+        self._send(handler, 200, self._completion(content, prompt, {"citations": citations}))
+
+    def _openai(self, handler, method, parsed, body, profile):
+        request = json.loads(body or b"{}")
+        if parsed.path.endswith("/embeddings"):
+            texts = request.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+            self._send(handler, 200, {
+                "object": "list",
+                "model": request.get("model", "mock"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": _embedding(text)}
+                    for i, text in enumerate(texts)
+                ],
+                "usage": {"prompt_tokens": sum(len(t) // 4 for t in texts), "total_tokens": sum(len(t) // 4 for t in texts)},
+            })
+            return
+        prompt = self._prompt_text(request)
+        avatar_ids = re.findall(r"Avatar (\S+):", prompt) or ["avatar_0"]
+        roll, _ = self._random()
+        content = json.dumps({
+            "reasoning": _filler(max(32, profile.payload_bytes)),
+            "best_match_avatar_id": avatar_ids[int(roll * len(avatar_ids))],
+            "confidence_score": round(0.5 + roll / 2, 2),
+        })
+        self._send(handler, 200, self._completion(content, prompt))
+
+    def _groq(self, handler, method, parsed, body, profile):
+        request = json.loads(body or b"{}")
+        prompt = self._prompt_text(request)
+        _, gauss = self._random()
+        who = "A young woman" if gauss > 0 else "A young man"
+        content = f"{who} with {_filler(max(40, profile.payload_bytes))}."
+        self._send(handler, 200, self._completion(content, prompt))
+
+    def _brave(self, handler, method, parsed, body, profile):
+        query = dict(parse_qsl(parsed.query)).get("q", "")
+        slug = hashlib.sha256(query.encode("utf-8")).hexdigest()[:12]
+        self._send(
+            handler,
+            200,
+            {"results": [{"properties": {"url": f"{self.base_url}/images/{slug}.jpg"}, "title": query}]},
+            headers={
+                "X-RateLimit-Limit": f"{self.brave_rate}, 15000",
+                "X-RateLimit-Remaining": f"{self.brave_rate}, 15000",
+                "X-RateLimit-Reset": "1, 1000000",
+            }
+        )
+
+    def _heygen(self, handler, method, parsed, body, profile):
+        self._send(handler, 200, {"error": None, "data": {"avatars": getattr(self, "heygen_avatars", [])}})
+
+    def _images(self, handler, method, parsed, body, profile):
+        size = max(64, int(math.sqrt(max(1, profile.payload_bytes)) * 16))
+        content = self._image_cache.get(size)
+        if content is None:
+            from PIL import Image
+            buffer = io.BytesIO()
+            Image.new("RGB", (size, size), (200, 120, 80)).save(buffer, "JPEG", quality=90)
+            content = self._image_cache.setdefault(size, buffer.getvalue())
+        etag = f'"{hashlib.sha256(parsed.path.encode() + content).hexdigest()[:16]}"'
+        if handler.headers.get("If-None-Match") == etag:
+            self._send(handler, 304, b"", content_type="image/jpeg", headers={"ETag": etag})
+            return
+        self._send(handler, 200, content, content_type="image/jpeg", headers={"ETag": etag})
+
+    def _supabase(self, handler, method, parsed, body, profile):
+        parts = parsed.path.strip("/").split("/")
+        # /supabase/rest/v1/<table>
+        if len(parts) < 4 or parts[1] != "rest":
+            self._send(handler, 404, {"message": "not found"})
+            return
+        table_name = parts[3]
+        params = parse_qsl(parsed.query, keep_blank_values=True)
+        prefer = handler.headers.get("Prefer", "")
+        db = self.db
+
+        select = None
+        filters: List[Tuple[str, str]] = []
+        order = None
+        limit = None
+        on_conflict = None
+        for key, value in params:
+            if key == "select":
+                select = [c.strip() for c in value.split(",") if c.strip()]
+            elif key == "order":
+                order = value
+            elif key == "limit":
+                limit = int(value)
+            elif key == "on_conflict":
+                on_conflict = value
+            elif key == "columns":
+                continue
+            else:
+                filters.append((key, value))
+
+        def selected(rows: List[Dict]) -> List[Dict]:
+            rows = [
+                row for row in rows
+                if all(_matches_or(row, v) if k == "or" else _matches(row, k, v) for k, v in filters)
+            ]
+            if order:
+                column, _, direction = order.partition(".")
+                rows.sort(key=lambda r: (r.get(column) is None, str(r.get(column))), reverse=direction.startswith("desc"))
+            if limit is not None:
+                rows = rows[:limit]
+            if select and select != ["*"]:
+                rows = [dict(_project(row, c) for c in select) for row in rows]
+            return rows
+
+        with db.lock:
+            table = db.table(table_name)
+            if method == "GET":
+                result = selected(list(table.values()))
+            elif method == "PATCH":
+                changes = json.loads(body or b"{}")
+                select = None
+                result = []
+                for row in selected(list(table.values())):
+                    row.update(changes)
+                    result.append(dict(row))
+            elif method == "POST":
+                rows = json.loads(body or b"[]")
+                rows = rows if isinstance(rows, list) else [rows]
+                merge = "merge-duplicates" in prefer
+                ignore = "ignore-duplicates" in prefer
+                pk = db.PRIMARY_KEYS.get(table_name, "id")
+                conflict = (on_conflict or pk).split(",")
+
+                def conflict_key(r: Dict) -> Optional[Tuple]:
+                    values = tuple(r.get(column) for column in conflict)
+                    return None if None in values else tuple(str(v) for v in values)
+
+                by_conflict = {conflict_key(r): r for r in table.values() if conflict_key(r) is not None}
+                result = []
+                for row in rows:
+                    existing = by_conflict.get(conflict_key(row)) if conflict_key(row) is not None else None
+                    if existing is not None and ignore:
+                        continue
+                    if existing is not None and merge:
+                        existing.update(row)
+                        result.append(dict(existing))
+                    elif existing is not None:
+                        self._send(handler, 409, {"code": "23505", "message": "duplicate key value violates unique constraint"})
+                        return
+                    else:
+                        row = dict(row)
+                        table[db.key_of(table_name, row)] = row
+                        if conflict_key(row) is not None:
+                            by_conflict[conflict_key(row)] = row
+                        result.append(dict(row))
+            elif method == "DELETE":
+                result = selected(list(table.values()))
+                pk = db.PRIMARY_KEYS.get(table_name, "id")
+                for row in result:
+                    table.pop(str(row.get(pk)), None)
+            else:
+                result = []
+
+        if "return=minimal" in prefer:
+            self._send(handler, 201 if method == "POST" else 204, b"")
+            return
+        self._send(handler, 201 if method == "POST" else 200, result)
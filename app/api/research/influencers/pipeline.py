@@ -0,0 +1,265 @@
+import os
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables before the stage modules read them at import time
+load_dotenv('.env.local')
+load_dotenv()
+
+from clients import get_supabase, get_openai
+from http_pool import close_async_clients
+from supabase_writer import BulkUpsertWriter
+from citation_store import CitationWriter
+from supabase_reader import iter_rows
+from influencer_images import fetch_image_url, update_influencer_image_url, BRAVE_CONCURRENCY
+from influencer_research import research_with_retries, RESEARCH_CONCURRENCY
+from work_journal import get_work_journal
+from metrics import start_run, finish_run, track
+from influencer_to_avatar import (
+    match_and_store,
+    replay_avatar_matches,
+    get_all_avatars,
+    MATCH_CONCURRENCY,
+    needs_avatar_index,
+    print_cascade_report,
+)
+from avatar_index import build_avatar_index
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))
+
+# Handlers return the item to pass downstream, or None to stop it at this stage
+Handler = Callable[[Dict], Awaitable[Optional[Dict]]]
+
+@dataclass
+class Stage:
+    """
+    One step of the pipeline: `concurrency` workers pull items from a bounded
+    queue, run `handler` and push the result to every downstream stage. A full
+    downstream queue blocks the workers, which is what applies backpressure.
+    Each item's handler time is recorded as the "stage:<name>" metric.
+    """
+    name: str
+    handler: Handler
+    concurrency: int = 1
+    queue_size: int = PIPELINE_QUEUE_SIZE
+    downstream: List["Stage"] = field(default_factory=list)
+    processed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+
+    def __post_init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.finished = asyncio.Event()
+        self.upstream: List["Stage"] = []
+
+    def then(self, *stages: "Stage") -> "Stage":
+        """Connect this stage to downstream stages; returns self for chaining."""
+        for stage in stages:
+            self.downstream.append(stage)
+            stage.upstream.append(self)
+        return self
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                started = time.monotonic()
+                try:
+                    with track("stage", self.name):
+                        result = await self.handler(item)
+                    self.processed += 1
+                except Exception as e:
+                    self.failed += 1
+                    result = None
+                    print(f"[{self.name}] Error processing {item.get('name', item.get('id'))}: {str(e)}")
+                finally:
+                    self.busy_seconds += time.monotonic() - started
+                # Hand the result on before marking the item done, or run() could
+                # stop this worker while it waits on a full downstream queue
+                if result is not None:
+                    for stage in self.downstream:
+                        await stage.queue.put(result)
+            finally:
+                self.queue.task_done()
+
+    async def run(self, source_done: asyncio.Event):
+        workers = [asyncio.create_task(self._worker()) for _ in range(max(1, self.concurrency))]
+        try:
+            # Drain only once nothing upstream can add more work
+            if self.upstream:
+                await asyncio.gather(*(stage.finished.wait() for stage in self.upstream))
+            else:
+                await source_done.wait()
+            await self.queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.finished.set()
+
+def _all_stages(roots: Iterable[Stage]) -> List[Stage]:
+    seen: List[Stage] = []
+    pending = list(roots)
+    while pending:
+        stage = pending.pop(0)
+        if stage not in seen:
+            seen.append(stage)
+            pending.extend(stage.downstream)
+    return seen
+
+async def run_pipeline(source: AsyncIterator[Dict], roots: List[Stage]) -> List[Stage]:
+    """Stream items from `source` into the root stages and run the DAG to completion."""
+    stages = _all_stages(roots)
+    source_done = asyncio.Event()
+    runners = [asyncio.create_task(stage.run(source_done)) for stage in stages]
+
+    try:
+        async for item in source:
+            for stage in roots:
+                await stage.queue.put(item)
+    except BaseException:
+        # Stop the stages before the caller's writers close underneath them
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+        raise
+    finally:
+        source_done.set()
+
+    await asyncio.gather(*runners)
+
+    for stage in stages:
+        print(f"[{stage.name}] processed {stage.processed}, failed {stage.failed}, busy {stage.busy_seconds:.1f}s")
+    return stages
+
+async def influencers_needing_work(supabase: "Client") -> AsyncIterator[Dict]:
+    """Stream every influencer still missing an image, research or avatar."""
+    count = 0
+    async for row in iter_rows(
+        supabase,
+        "influencers",
+        "id, name, tiktok_profile_link, image_url, avatar_id, has_research:influencer_research->>content",
+        where=lambda query: query.or_("image_url.is.null,influencer_research.is.null,avatar_id.is.null")
+    ):
+        # Only whether research exists matters downstream, not the payload
+        row["has_research"] = row["has_research"] is not None
+        count += 1
+        yield row
+    print(f"Found {count} influencers with pending work")
+
+async def prepare_avatar_catalog(refresh: bool = True) -> Dict:
+    """
+    Refresh HeyGen avatars and their descriptions, then load the catalog and
+    embedding index used by the matching stage.
+    """
+    if refresh:
+        from fetch_avatars import get_heygen_avatars, update_supabase_avatars
+        from avatar_descriptions import update_avatar_descriptions
+
+        avatars = await asyncio.to_thread(get_heygen_avatars)
+        if avatars:
+            await asyncio.to_thread(update_supabase_avatars, avatars)
+        await asyncio.to_thread(update_avatar_descriptions)
+
+    avatars = await asyncio.to_thread(get_all_avatars)
+    index = None
+    if avatars and needs_avatar_index(avatars):
+        index = await build_avatar_index(get_openai(), avatars)
+    return {"avatars": avatars, "index": index}
+
+async def run_influencer_pipeline(
+    ingest: bool = False,
+    refresh_catalog: bool = True,
+    image_concurrency: int = BRAVE_CONCURRENCY,
+    research_concurrency: int = RESEARCH_CONCURRENCY,
+    match_concurrency: int = MATCH_CONCURRENCY,
+    queue_size: int = PIPELINE_QUEUE_SIZE
+):
+    """
+    Run research and image search -> avatar matching per influencer, with the
+    avatar catalog prepared concurrently. Each influencer moves on as soon as its
+    own previous stage is done instead of waiting for a full batch pass. With
+    `ingest`, the seed roster from get_influencers is inserted first.
+    """
+    supabase = get_supabase()
+    if ingest:
+        from get_influencers import parse_influencers, insert_influencers, input_text
+        await asyncio.to_thread(insert_influencers, parse_influencers(input_text))
+
+    # Finish whatever a previous crashed run computed but never wrote
+    journal = get_work_journal()
+    await replay_avatar_matches(journal)
+
+    catalog = asyncio.create_task(prepare_avatar_catalog(refresh_catalog))
+
+    async def find_image(influencer: Dict) -> Optional[Dict]:
+        if not influencer.get("image_url"):
+            if not influencer.get("name"):
+                return None
+            image_url = await fetch_image_url(influencer["name"])
+            if not image_url:
+                print(f"No image URL found for {influencer['name']}")
+                return None
+            await asyncio.to_thread(update_influencer_image_url, influencer["id"], image_url)
+            influencer["image_url"] = image_url
+        return influencer
+
+    async def match_avatar(influencer: Dict) -> Optional[Dict]:
+        if influencer.get("avatar_id"):
+            return influencer
+        prepared = await catalog
+        if not prepared["avatars"]:
+            return None
+        result = await match_and_store(influencer, prepared["avatars"], prepared["index"], journal)
+        if not result["success"]:
+            raise Exception(result.get("error", "Unknown error"))
+        influencer["avatar_id"] = result.get("avatar_id")
+        return influencer
+
+    async with BulkUpsertWriter(
+        supabase,
+        "influencers",
+        on_conflict="id",
+        journal=journal,
+        journal_stage="research"
+    ) as writer, CitationWriter(supabase, journal=journal) as citations:
+        await writer.replay_journal()
+        await citations.replay_journal()
+
+        async def research(influencer: Dict) -> Optional[Dict]:
+            if influencer.get("has_research"):
+                return influencer
+            if not await research_with_retries(influencer, writer, journal=journal, citations=citations):
+                raise Exception("research failed")
+            influencer["has_research"] = True
+            return influencer
+
+        images = Stage("images", find_image, image_concurrency, queue_size)
+        research_stage = Stage("research", research, research_concurrency, queue_size)
+        matching = Stage("matching", match_avatar, match_concurrency, queue_size)
+        images.then(matching)
+
+        try:
+            await run_pipeline(influencers_needing_work(supabase), [images, research_stage])
+            await catalog
+            print_cascade_report()
+        finally:
+            if not catalog.done():
+                catalog.cancel()
+
+async def main(ingest: bool = False, refresh_catalog: bool = True):
+    start_run()
+    try:
+        await run_influencer_pipeline(ingest=ingest, refresh_catalog=refresh_catalog)
+    finally:
+        await close_async_clients()
+        finish_run()
+
+if __name__ == "__main__":
+    asyncio.run(main())
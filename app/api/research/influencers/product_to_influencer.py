@@ -0,0 +1,208 @@
+import os
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional
+from avatar_index import embed_texts, EMBEDDING_MODEL
+from vector_store import VectorStore
+from clients import get_openai, get_supabase
+from supabase_reader import iter_rows
+from metrics import track
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+INFLUENCER_INDEX_PATH = os.getenv(
+    "INFLUENCER_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "influencer_vectors")
+)
+INFLUENCER_VECTOR_DTYPE = os.getenv("INFLUENCER_VECTOR_DTYPE", "float32")  # float16 halves the files
+INFLUENCER_IVF_MIN_ROWS = int(os.getenv("INFLUENCER_IVF_MIN_ROWS", "100000"))  # Exact search below this
+PRODUCT_MATCH_TOP_K = int(os.getenv("PRODUCT_MATCH_TOP_K", "20"))
+INDEX_EMBED_BATCH = 1024  # Changed influencers embedded per round while syncing
+SYNC_OVERLAP_SECONDS = 300  # Re-read rows this close to the last sync to absorb clock skew
+
+# Research fields that say who an influencer's audience is and what they talk about
+INFLUENCER_FIELDS = {
+    "keyTopics": ["primaryTopics", "recurringThemes", "brandAlignments", "valueProposition"],
+    "targetAudience": ["demographics", "interests", "locationFocus"],
+    "content": ["mainCategories", "contentStyle", "popularContentTypes"],
+}
+
+# Parts of the consolidated product research that describe who it is for
+PRODUCT_FIELDS = [
+    ("productSummary", "overview"),
+    ("productSummary", "valueProposition"),
+    ("productSummary", "keyInsights"),
+    ("recommendations", "targetAudience"),
+    ("recommendations", "marketingAngles"),
+    ("recommendations", "contentStrategy", "suggestedTopics"),
+    ("recommendations", "contentStrategy", "keyMessages"),
+]
+
+def _text(value) -> str:
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value if item)
+    return str(value) if value else ""
+
+def research_text(research: Dict) -> str:
+    """The research fields matched against products, one line per field."""
+    lines = []
+    for area, fields in INFLUENCER_FIELDS.items():
+        section = research.get(area) or {}
+        for field in fields:
+            text = _text(section.get(field))
+            if text:
+                lines.append(f"{field}: {text}")
+    return "\n".join(lines)
+
+def product_text(product_research: Dict) -> str:
+    """The audience and positioning parts of a research row's product_research."""
+    summary = product_research.get("summary", product_research)
+    lines = []
+    for path in PRODUCT_FIELDS:
+        value = summary
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        text = _text(value)
+        if text:
+            lines.append(f"{path[-1]}: {text}")
+    return "\n".join(lines)
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def open_influencer_index(path: str = INFLUENCER_INDEX_PATH) -> VectorStore:
+    """
+    The on-disk store of influencer research embeddings, keyed by influencer id
+    and tagged with the hash of the embedded text. Opening it maps the files
+    instead of reading them, so it is instant at any size.
+    """
+    return VectorStore(path, INFLUENCER_VECTOR_DTYPE, {"model": EMBEDDING_MODEL})
+
+def _maintain(index: VectorStore) -> None:
+    # Reclaim replaced rows once they are a quarter of the files
+    if index.rows and len(index) < index.rows * 0.75:
+        index.compact()
+    # Partition big stores, again once a tenth of the rows were added since
+    if len(index) >= INFLUENCER_IVF_MIN_ROWS and index.rows - index.meta["ivf_rows"] > index.rows * 0.1:
+        index.build_ivf()
+
+async def sync_influencer_index(
+    client: Optional["AsyncOpenAI"] = None,
+    index: Optional[VectorStore] = None,
+    full: bool = False
+) -> VectorStore:
+    """
+    Bring the index up to date with influencer_research. Only influencers
+    updated since the last sync are read, and only those whose research text
+    changed are embedded and appended. `full` reads every researched influencer
+    and also deletes the ones whose research is gone.
+    """
+    client = client or get_openai()
+    index = index or open_influencer_index()
+    if index.metadata.get("model") != EMBEDDING_MODEL:
+        index.clear({"model": EMBEDDING_MODEL})
+    synced_at = index.metadata.get("synced_at")
+    if synced_at is None:
+        full = True
+
+    started = time.time()
+    since = None if full else synced_at - SYNC_OVERLAP_SECONDS
+
+    def where(query):
+        query = query.not_.is_("influencer_research", "null")
+        if since is not None:
+            query = query.gte("updated_at", datetime.fromtimestamp(since, timezone.utc).isoformat())
+        return query
+
+    seen = set()
+    pending: Dict[str, tuple] = {}
+    embedded = 0
+
+    async def embed_pending() -> None:
+        nonlocal embedded
+        ids = list(pending)
+        vectors = await embed_texts(client, [pending[i][1] for i in ids])
+        await asyncio.to_thread(index.add, ids, vectors, [pending[i][0] for i in ids])
+        embedded += len(ids)
+        pending.clear()
+
+    async for row in iter_rows(
+        get_supabase(),
+        "influencers",
+        "id, keyTopics:influencer_research->keyTopics, targetAudience:influencer_research->targetAudience, "
+        "content:influencer_research->content",
+        where=where
+    ):
+        seen.add(row["id"])
+        text = research_text(row)
+        if not text:
+            continue
+        h = text_hash(text)
+        if index.tag(row["id"]) != h:
+            pending[row["id"]] = (h, text)
+            if len(pending) >= INDEX_EMBED_BATCH:
+                await embed_pending()
+    if pending:
+        await embed_pending()
+
+    removed = 0
+    if full:
+        gone = [key for key in index.keys() if key not in seen]
+        index.delete(gone)
+        removed = len(gone)
+
+    index.set_metadata(synced_at=started)
+    await asyncio.to_thread(_maintain, index)
+    print(f"Influencer index ready: {len(index)} influencers ({embedded} embedded, {removed} removed)")
+    return index
+
+async def match_product(
+    product_research: Dict,
+    index: VectorStore,
+    k: int = PRODUCT_MATCH_TOP_K,
+    client: Optional["AsyncOpenAI"] = None
+) -> List[Dict]:
+    """Rank influencers for a product's research; returns the top-k as [{'influencer_id', 'score'}]."""
+    text = product_text(product_research)
+    if not text:
+        raise ValueError("Product research has no summary to match on")
+    query = await embed_texts(client or get_openai(), [text])
+    started = time.perf_counter()
+    matches = [{"influencer_id": key, "score": score} for key, score in index.search(query[0], k)]
+    print(f"Ranked {len(index)} influencers in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return matches
+
+async def match_research_row(research_id: str, k: int = PRODUCT_MATCH_TOP_K, full: bool = False) -> List[Dict]:
+    """Sync the index, then rank influencers for the product of one `research` row."""
+    with track("supabase", "select:research"):
+        rows = get_supabase().table("research").select("product_research").eq("id", research_id).execute().data
+    if not rows or not rows[0].get("product_research"):
+        raise ValueError(f"No product research for {research_id}")
+
+    index = await sync_influencer_index(full=full)
+    return await match_product(rows[0]["product_research"], index, k)
+
+if __name__ == "__main__":
+    import argparse
+    from http_pool import close_async_clients
+    from metrics import start_run, finish_run
+
+    parser = argparse.ArgumentParser(description="Rank influencers for a product by their research.")
+    parser.add_argument("research_id", help="id of the research row holding the product research")
+    parser.add_argument("-k", type=int, default=PRODUCT_MATCH_TOP_K, help="how many influencers to return")
+    parser.add_argument("--full", action="store_true", help="re-read every influencer, not just recent updates")
+    args = parser.parse_args()
+
+    async def main():
+        start_run()
+        try:
+            for rank, match in enumerate(await match_research_row(args.research_id, args.k, args.full), 1):
+                print(f"{rank:3}. {match['influencer_id']}  {match['score']:.3f}")
+        finally:
+            await close_async_clients()
+            finish_run()
+
+    asyncio.run(main())
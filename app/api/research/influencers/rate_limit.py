@@ -0,0 +1,324 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+
+class TokenBucket:
+    """
+    Async token bucket shared by every caller of one provider.
+    Refills `rate` tokens per second up to `burst`; waiters are served in order.
+    A `rate` of 0 (or less) means unlimited. The bucket can be used from
+    successive event loops (e.g. several asyncio.run calls in one process).
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _loop_lock(self) -> asyncio.Lock:
+        # An asyncio.Lock is bound to the loop that first waits on it
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate <= 0:
+            self.tokens = float(self.burst)
+            self.updated = now
+            return
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until `tokens` are available and take them."""
+        async with self._loop_lock():
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def set_rate(self, rate: float, burst: Optional[int] = None) -> None:
+        """Change the refill rate (and optionally burst), e.g. to a limit the provider reports."""
+        self._refill()
+        self.rate = rate
+        if burst is not None:
+            self.burst = max(1, burst)
+            self.tokens = min(self.tokens, self.burst)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (e.g. after a 429)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+# Provider name -> bucket, shared across every module in the process
+_limiters: Dict[str, TokenBucket] = {}
+
+def configure_limiter(provider: str, requests_per_minute: float, burst: Optional[int] = None) -> TokenBucket:
+    """Create (or replace) the request budget for a provider; 0 requests per minute is unlimited."""
+    limiter = TokenBucket(requests_per_minute / 60.0, burst or 1)
+    _limiters[provider] = limiter
+    return limiter
+
+def get_limiter(provider: str, default_rpm: float = 60, default_burst: int = 1) -> TokenBucket:
+    """
+    Return the provider-wide bucket, configured on first use from
+    <PROVIDER>_RPM / <PROVIDER>_BURST env vars or the given defaults.
+    """
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        rpm = float(os.getenv(f"{provider.upper()}_RPM", default_rpm))
+        burst = int(os.getenv(f"{provider.upper()}_BURST", default_burst))
+        limiter = configure_limiter(provider, rpm, burst)
+    return limiter
+
+class RateLimitError(Exception):
+    """A provider answered 429; `retry_after` is its hint in seconds, if any."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def is_rate_limited(error: BaseException) -> bool:
+    """
+    True if `error` is a throttling response from any provider: our own
+    RateLimitError, an SDK error carrying status 429 (OpenAI, Groq) or an
+    httpx.HTTPStatusError for a 429.
+    """
+    if isinstance(error, RateLimitError):
+        return True
+    if getattr(error, "status_code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    # Wrapping errors (e.g. a partial research failure) chain the 429 that caused them
+    return error.__cause__ is not None and is_rate_limited(error.__cause__)
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """The Retry-After hint carried by a rate limit error, in seconds."""
+    if isinstance(error, RateLimitError):
+        return error.retry_after
+    if error.__cause__ is not None:
+        return retry_after(error.__cause__)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After")) if headers.get("Retry-After") else None
+    except (TypeError, ValueError):
+        return None
+
+class ConcurrencySlot:
+    """One in-flight call; mark `throttled` if the provider pushed back without raising."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.throttled = False
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight calls to one provider, shared by every module (and
+    thread) that calls it. Each healthy call raises the limit by about one per
+    round of calls, up to `max_limit`. A call is healthy when it succeeded
+    within `latency_tolerance` times the best latency of the last
+    `baseline_window` seconds, so one lucky fast response only sets the bar
+    for that long. A 429 or a timeout
+    multiplies the limit by `decrease`. It is cut at most once per `cooldown`
+    seconds, so one burst of 429s doesn't collapse it to the minimum.
+
+        async with get_concurrency("openai").slot():
+            response = await client.chat.completions.create(...)
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        max_limit: int,
+        initial: Optional[int] = None,
+        min_limit: int = 1,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        cooldown: float = 5.0,
+        baseline_window: float = 60.0
+    ):
+        self.provider = provider
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial or self.min_limit)))
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.baseline_window = baseline_window
+        self.in_flight = 0
+        self.throttles = 0
+        # (time, latency) of successful calls with increasing latency; the
+        # first entry is the fastest call of the window
+        self._recent: Deque[tuple] = deque()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._thread_waiters = threading.Condition(self._lock)
+        self._async_waiters: Deque["_Waiter"] = deque()
+
+    def _try_take(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _wake(self) -> None:
+        # Hand freed capacity to async waiters first, then to threads
+        while self._async_waiters and self.in_flight < int(self.limit):
+            waiter = self._async_waiters.popleft()
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+        self._thread_waiters.notify_all()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_take():
+                return
+            waiter = _Waiter(loop)
+            self._async_waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                # The slot may have been granted just before the cancel landed
+                if waiter.granted:
+                    self.in_flight -= 1
+                    self._wake()
+            raise
+
+    def acquire_sync(self) -> None:
+        with self._lock:
+            while not self._try_take():
+                self._thread_waiters.wait()
+
+    def release(self, latency: float, throttled: bool = False) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttles += 1
+                if now - self._last_decrease >= self.cooldown:
+                    before = self.limit
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+                    print(f"[{self.provider}] throttled, concurrency {int(before)} -> {int(self.limit)}")
+            else:
+                if latency <= self._baseline(now, latency) * self.latency_tolerance:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / max(1.0, self.limit))
+            self._wake()
+
+    @property
+    def best_latency(self) -> Optional[float]:
+        """Fastest successful call of the last `baseline_window` seconds."""
+        return self._recent[0][1] if self._recent else None
+
+    def _baseline(self, now: float, latency: float) -> float:
+        # Sliding-window minimum: drop calls that are slower than this one or
+        # older than the window, then read the minimum off the front
+        while self._recent and self._recent[-1][1] >= latency:
+            self._recent.pop()
+        self._recent.append((now, latency))
+        while self._recent[0][0] < now - self.baseline_window:
+            self._recent.popleft()
+        return self._recent[0][1]
+
+    def _finish(self, slot: ConcurrencySlot, error: Optional[BaseException]) -> None:
+        throttled = slot.throttled
+        if error is not None:
+            throttled = throttled or is_rate_limited(error) or "timeout" in type(error).__name__.lower()
+        latency = time.monotonic() - slot.started
+        # Other failures say nothing about capacity: release without growing
+        if error is not None and not throttled:
+            with self._lock:
+                self.in_flight -= 1
+                self._wake()
+            return
+        self.release(latency, throttled)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[ConcurrencySlot]:
+        await self.acquire()
+        slot = ConcurrencySlot()
+        try:
+            yield slot
+        except BaseException as e:
+            self._finish(slot, e)
+            raise
+        self._finish(slot, None)
+
+    @contextmanager
+    def sync_slot(self) -> Iterator[ConcurrencySlot]:
+        """Blocking variant of `slot` for calls made from worker threads."""
+        self.acquire_sync()
+        slot = ConcurrencySlot()
+        try:
+            yield slot
+        except BaseException as e:
+            self._finish(slot, e)
+            raise
+        self._finish(slot, None)
+
+class _Waiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+        self.cancelled = False
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+# Default in-flight ceilings, overridable with <PROVIDER>_MAX_CONCURRENCY
+MAX_CONCURRENCY = {
+    "perplexity": 8,
+    "openai": 16,
+    "groq": 4,
+    "brave": 4,
+}
+
+# Provider name -> in-flight limit, shared across every module in the process
+_concurrency: Dict[str, AdaptiveConcurrency] = {}
+_concurrency_lock = threading.Lock()
+
+def get_concurrency(provider: str, default_initial: int = 2) -> AdaptiveConcurrency:
+    """
+    Return the provider-wide adaptive concurrency limit, configured on first use
+    from <PROVIDER>_MAX_CONCURRENCY / <PROVIDER>_INITIAL_CONCURRENCY env vars or
+    the defaults above.
+    """
+    with _concurrency_lock:
+        controller = _concurrency.get(provider)
+        if controller is None:
+            default_max = MAX_CONCURRENCY.get(provider, 8)
+            max_limit = int(os.getenv(f"{provider.upper()}_MAX_CONCURRENCY", default_max))
+            initial = int(os.getenv(f"{provider.upper()}_INITIAL_CONCURRENCY", default_initial))
+            controller = AdaptiveConcurrency(provider, max_limit, initial)
+            _concurrency[provider] = controller
+        return controller
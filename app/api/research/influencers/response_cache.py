@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Optional, Tuple
+
+CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "responses.sqlite3")
+)
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(30 * 24 * 3600)))  # 30 days
+CACHE_NEGATIVE_TTL = float(os.getenv("RESPONSE_CACHE_NEGATIVE_TTL", str(24 * 3600)))  # 1 day
+CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_BYPASS = os.getenv("RESPONSE_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+CACHE_SWEEP_EVERY = 500  # Writes between sweeps of expired entries
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so formatting-only prompt edits share a cache entry."""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+class ResponseCache:
+    """
+    Content-addressed cache of provider responses in a single SQLite file.
+    Entries expire after their TTL and the least recently used ones are evicted
+    once the stored payloads exceed `max_bytes`. A `None` value is a cached
+    negative result (e.g. "no image found").
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl: float = CACHE_TTL,
+        negative_ttl: float = CACHE_NEGATIVE_TTL,
+        max_bytes: int = CACHE_MAX_BYTES,
+        bypass: bool = CACHE_BYPASS
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._total: Optional[int] = None
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    value TEXT,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+            self._total = None
+        return self._conn
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str, image: Optional[str] = None, **params: Any) -> str:
+        """
+        Hash provider, model, normalized prompt, image URL/hash and any sampling
+        `params` (temperature, max_tokens, ...) into a cache key.
+        """
+        digest = hashlib.sha256()
+        extra = [f"{name}={params[name]!r}" for name in sorted(params)]
+        for part in (provider, model, normalize_prompt(prompt), image or "", *extra):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return f"{provider}:{digest.hexdigest()}"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, value). Always a miss when the cache is bypassed."""
+        if self.bypass:
+            return False, None
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            if row[1] < now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return False, None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return True, None if row[0] is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a response; `None` is stored as a negative result with the negative TTL."""
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        payload = None if value is None else json.dumps(value)
+        size = len(payload) if payload else 0
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, key.split(":", 1)[0], payload, size, now + ttl, now)
+            )
+            # A running total keeps writes O(1); it overcounts replaced entries and
+            # other processes' writes are missed, so every sweep recounts exactly
+            if self._total is None:
+                self._total = self._stored_bytes(conn)
+            self._total += size
+            self._writes += 1
+            if self._total > self.max_bytes or self._writes >= CACHE_SWEEP_EVERY:
+                self._evict(conn)
+            conn.commit()
+
+    @staticmethod
+    def _stored_bytes(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        self._writes = 0
+        conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        total = self._stored_bytes(conn)
+        self._total = total
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        excess = total - self.max_bytes
+        freed = 0
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self._total = total - freed
+
+    def clear(self, provider: Optional[str] = None) -> None:
+        """Remove all entries, or only those of one provider."""
+        with self._lock:
+            conn = self._connection()
+            if provider:
+                conn.execute("DELETE FROM responses WHERE provider = ?", (provider,))
+            else:
+                conn.execute("DELETE FROM responses")
+            conn.commit()
+            self._total = None
+
+_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide response cache."""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
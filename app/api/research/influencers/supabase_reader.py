@@ -0,0 +1,121 @@
+import os
+import asyncio
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+from metrics import track
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+READ_PAGE_SIZE = int(os.getenv("SUPABASE_READ_PAGE_SIZE", "500"))
+
+# Adds filters to a select query, e.g. lambda query: query.is_("avatar_id", "null")
+QueryFilter = Callable[[Any], Any]
+
+def _with_key(columns: str, key: str) -> str:
+    names = [column.strip() for column in columns.split(",")]
+    return columns if key in names or "*" in names else f"{key}, {columns}"
+
+def fetch_page(
+    client: "Client",
+    table: str,
+    columns: str,
+    key: str = "id",
+    after: Optional[Any] = None,
+    page_size: int = READ_PAGE_SIZE,
+    where: Optional[QueryFilter] = None
+) -> List[Dict]:
+    """One page of rows ordered by `key`, starting after the key value `after`."""
+    query = client.table(table).select(_with_key(columns, key))
+    if where is not None:
+        query = where(query)
+    if after is not None:
+        query = query.gt(key, after)
+    with track("supabase", f"select:{table}"):
+        return query.order(key).limit(page_size).execute().data
+
+def iter_rows_sync(
+    client: "Client",
+    table: str,
+    columns: str,
+    key: str = "id",
+    page_size: int = READ_PAGE_SIZE,
+    where: Optional[QueryFilter] = None
+) -> Iterator[Dict]:
+    """Blocking variant of `iter_rows` for scripts that don't run an event loop."""
+    after = None
+    while True:
+        page = fetch_page(client, table, columns, key, after, page_size, where)
+        yield from page
+        if not page:
+            return
+        after = page[-1][key]
+
+async def iter_rows(
+    client: "Client",
+    table: str,
+    columns: str,
+    key: str = "id",
+    page_size: int = READ_PAGE_SIZE,
+    where: Optional[QueryFilter] = None
+) -> AsyncIterator[Dict]:
+    """
+    Stream every row of `table` matching `where`, one keyset page at a time.
+    Pages continue after the last key seen rather than at an offset, so rows the
+    caller updates out of the filter while iterating don't shift later pages, and
+    nothing is dropped by PostgREST's response cap. Only an empty page ends the
+    stream: a short one may just be that cap applied to a larger `page_size`.
+    The next page is fetched while the current one is being consumed.
+    """
+    def fetch(after):
+        return asyncio.create_task(
+            asyncio.to_thread(fetch_page, client, table, columns, key, after, page_size, where)
+        )
+
+    pending = fetch(None)
+    try:
+        while pending is not None:
+            page = await pending
+            pending = fetch(page[-1][key]) if page else None
+            for row in page:
+                yield row
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+async def for_each_row(
+    rows: AsyncIterator[Dict],
+    handler: Callable[[Dict], Awaitable[None]],
+    concurrency: int,
+    queue_size: Optional[int] = None
+) -> int:
+    """
+    Run `handler` over a row stream with `concurrency` workers. The queue between
+    them is bounded, so rows are only read as fast as they are processed.
+    Returns the number of rows handled.
+    """
+    concurrency = max(1, concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or concurrency * 2)
+    count = 0
+
+    async def worker():
+        while True:
+            row = await queue.get()
+            if row is None:
+                return
+            try:
+                await handler(row)
+            except Exception as e:
+                print(f"Error processing row {row.get('id', '')}: {str(e)}")
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        async for row in rows:
+            count += 1
+            await queue.put(row)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    return count
@@ -0,0 +1,118 @@
+import os
+import asyncio
+from typing import TYPE_CHECKING, Dict, List, Optional
+from work_journal import WorkJournal
+from metrics import track
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+WRITE_BATCH_SIZE = int(os.getenv("SUPABASE_WRITE_BATCH_SIZE", "100"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("SUPABASE_WRITE_FLUSH_INTERVAL", "5"))
+
+class BulkUpsertWriter:
+    """
+    Buffers rows for one table and writes them as chunked bulk upserts keyed on
+    `on_conflict`. A flush happens whenever `batch_size` rows are buffered, every
+    `flush_interval` seconds, and on exit. Rows from a failed chunk stay buffered
+    and are retried on the next flush. With a `journal`, every added row is
+    recorded under `journal_stage` first and marked written after its flush, so
+    rows lost in a crash can be replayed with `replay_journal`.
+
+        async with BulkUpsertWriter(supabase, "influencers") as writer:
+            await writer.add({"id": ..., "name": ..., "influencer_research": ...})
+    """
+
+    def __init__(
+        self,
+        client: "Client",
+        table: str,
+        on_conflict: str = "id",
+        batch_size: int = WRITE_BATCH_SIZE,
+        flush_interval: float = WRITE_FLUSH_INTERVAL,
+        journal: Optional[WorkJournal] = None,
+        journal_stage: Optional[str] = None
+    ):
+        self.client = client
+        self.table = table
+        self.on_conflict = on_conflict
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.journal = journal
+        self.journal_stage = journal_stage or table
+        self.written = 0
+        self._buffer: Dict[str, Dict] = {}
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "BulkUpsertWriter":
+        if self.flush_interval > 0:
+            self._timer = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def add(self, row: Dict) -> None:
+        """Buffer a row; a later row with the same key replaces an earlier one."""
+        key = str(row[self.on_conflict])
+        if self.journal is not None:
+            self.journal.complete(self.journal_stage, key, row)
+        self._buffer[key] = row
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write every buffered row, one upsert request per chunk."""
+        async with self._lock:
+            rows = list(self._buffer.values())
+            self._buffer.clear()
+            for start in range(0, len(rows), self.batch_size):
+                chunk = rows[start:start + self.batch_size]
+                try:
+                    await asyncio.to_thread(self._upsert, chunk)
+                    self.written += len(chunk)
+                    if self.journal is not None:
+                        self.journal.mark_written(
+                            self.journal_stage,
+                            [str(row[self.on_conflict]) for row in chunk]
+                        )
+                except Exception as e:
+                    print(f"Error upserting {len(chunk)} rows into {self.table}: {str(e)}")
+                    for row in chunk:
+                        self._buffer.setdefault(str(row[self.on_conflict]), row)
+
+    async def replay_journal(self) -> int:
+        """Re-buffer journaled rows that were never written; returns how many."""
+        if self.journal is None:
+            return 0
+        pending = self.journal.unwritten(self.journal_stage)
+        for key, row in pending:
+            self._buffer[key] = row
+        if pending:
+            print(f"Replaying {len(pending)} unwritten rows into {self.table}")
+            await self.flush()
+        return len(pending)
+
+    def _upsert(self, rows: List[Dict]) -> None:
+        with track("supabase", f"upsert:{self.table}"):
+            self.client.table(self.table).upsert(rows, on_conflict=self.on_conflict).execute()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._buffer:
+                await self.flush()
+
+    async def close(self) -> None:
+        """Stop the flush timer and write whatever is still buffered."""
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        await self.flush()
+        if self._buffer:
+            print(f"Failed to write {len(self._buffer)} rows into {self.table}")
@@ -0,0 +1,59 @@
+import numpy as np
+from vector_store import VectorStore
+
+def unit(*values: float) -> np.ndarray:
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_add_keeps_last_vector_for_repeated_key(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add(["a", "b", "a"], np.vstack([unit(1, 0), unit(0, 1), unit(1, 1)]), ["t1", "t2", "t3"])
+
+    assert len(store) == 2
+    assert sorted(store.keys()) == ["a", "b"]
+    assert np.allclose(store.get("a"), unit(1, 1))
+    assert store.tag("a") == "t3"
+
+def test_deleted_key_is_not_returned_by_search(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add(["a", "b"], np.vstack([unit(1, 0), unit(0.9, 0.1)]))
+    store.delete(["a"])
+
+    assert "a" not in store
+    assert [key for key, _ in store.search(unit(1, 0), k=2)] == ["b"]
+
+def test_compact_remaps_other_instances(tmp_path):
+    writer = VectorStore(str(tmp_path))
+    reader = VectorStore(str(tmp_path))
+    writer.add(["a", "b", "c"], np.vstack([unit(1, 0), unit(0, 1), unit(1, 1)]))
+    writer.delete(["a"])
+    writer.compact()
+
+    reader.refresh()
+    assert sorted(reader.keys()) == ["b", "c"]
+    assert np.allclose(reader.get("c"), unit(1, 1))
+    assert reader.search(unit(0, 1), k=1)[0][0] == "b"
+
+def test_reopen_after_generation_bump(tmp_path):
+    store = VectorStore(str(tmp_path), metadata={"model": "old"})
+    store.add(["a"], np.vstack([unit(1, 0)]))
+    store.clear({"model": "new"})
+    store.add(["b"], np.vstack([unit(0, 1, 0)]))
+
+    reopened = VectorStore(str(tmp_path))
+    assert reopened.metadata == {"model": "new"}
+    assert reopened.dim == 3
+    assert reopened.keys() == ["b"]
+    assert reopened.search(unit(0, 1, 0), k=1)[0][0] == "b"
+
+def test_build_ivf_clamps_nlist_to_sample(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(40, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store = VectorStore(str(tmp_path))
+    store.add([f"k{i}" for i in range(40)], vectors)
+
+    store.build_ivf(nlist=50, sample=10)
+
+    assert store.meta["ivf_rows"] == 40
+    assert store.search(vectors[7], k=1, nprobe=10)[0][0] == "k7"
@@ -0,0 +1,356 @@
+import os
+import json
+import fcntl
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+IVF_NPROBE = int(os.getenv("VECTOR_STORE_NPROBE", "8"))  # Lists scanned per approximate search
+SEARCH_BLOCK_ROWS = 1 << 18  # Rows scored per block, bounds the float32 temporaries
+
+# Per-row record in keys.bin: the caller's key and a short tag such as a content hash
+RECORD = np.dtype([("key", "S64"), ("tag", "S16")])
+
+class VectorStore:
+    """
+    Append-only vector store in a directory of flat files that are memory
+    mapped, never read into memory, so opening it costs the same for any number
+    of rows and processes mapping the same files share their pages:
+
+        meta.json     dim, dtype, row count covered by the IVF, generation, caller metadata
+        vectors.bin   row-major float32 or float16 matrix
+        keys.bin      one (key, tag) record per row
+        deleted.bin   one byte per row, set when the row is deleted or replaced
+
+    Adding a key that exists tombstones its old row and appends a new one.
+    `search` is exact unless `build_ivf` has partitioned the rows, in which case
+    only the nearest lists (plus rows added since) are scanned. Scores are dot
+    products, i.e. cosine similarity for unit vectors. Writers take a file lock;
+    readers see other processes' appends after `refresh`. Rewriting the files
+    (`compact`, `clear`) bumps the generation, which makes `refresh` remap
+    everything instead of only the appended rows.
+    """
+
+    def __init__(self, path: str, dtype: str = "float32", metadata: Optional[Dict] = None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(self._meta_path):
+            with self._locked():
+                # Another process may have created the store while we waited
+                if not os.path.exists(self._meta_path):
+                    self.meta = {"dim": None, "dtype": np.dtype(dtype).name, "ivf_rows": 0, "metadata": metadata or {}}
+                    self._write_meta()
+        with open(self._meta_path) as f:
+            self.meta = json.load(f)
+        self.dtype = np.dtype(self.meta["dtype"])
+        self.rows = 0
+        self._generation = self.meta.get("generation", 0)
+        self._vectors = np.zeros((0, self.dim or 0), dtype=self.dtype)
+        self._records = np.zeros(0, dtype=RECORD)
+        self._deleted = np.zeros(0, dtype=np.uint8)
+        self._ivf: Optional[Dict[str, np.ndarray]] = None
+        self._keys: Optional[Dict[str, int]] = None
+        self.refresh()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.meta["dim"]
+
+    @property
+    def metadata(self) -> Dict:
+        return self.meta["metadata"]
+
+    def _write_meta(self) -> None:
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path)
+
+    def set_metadata(self, **values) -> None:
+        with self._locked():
+            self.meta["metadata"].update(values)
+            self._write_meta()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self._file("lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rows_on_disk(self) -> int:
+        if not self.dim:
+            return 0
+        sizes = [
+            os.path.getsize(self._file(name)) // width if os.path.exists(self._file(name)) else 0
+            for name, width in (
+                ("vectors.bin", self.dim * self.dtype.itemsize),
+                ("keys.bin", RECORD.itemsize),
+                ("deleted.bin", 1),
+            )
+        ]
+        # A torn append is ignored until the next add overwrites it
+        return min(sizes)
+
+    def refresh(self) -> None:
+        """Map rows appended (by any process) since the store was opened or last refreshed."""
+        with open(self._meta_path) as f:
+            self.meta = json.load(f)
+        generation = self.meta.get("generation", 0)
+        if generation != self._generation:
+            # The files were rewritten; mappings of the old ones are stale even
+            # when the row count happens to match
+            self._generation = generation
+            self.rows = -1
+            self._keys = None
+            self._ivf = None
+        rows = self._rows_on_disk()
+        if rows != self.rows:
+            if rows:
+                self._vectors = np.memmap(self._file("vectors.bin"), self.dtype, "r", shape=(rows, self.dim))
+                self._records = np.memmap(self._file("keys.bin"), RECORD, "r", shape=(rows,))
+                self._deleted = np.memmap(self._file("deleted.bin"), np.uint8, "r+", shape=(rows,))
+            else:
+                self._vectors = np.zeros((0, self.dim or 0), dtype=self.dtype)
+                self._records = np.zeros(0, dtype=RECORD)
+                self._deleted = np.zeros(0, dtype=np.uint8)
+            if rows < self.rows:
+                self._keys = None
+            elif self._keys is not None:
+                self._index_keys(self.rows, rows)
+            self.rows = rows
+        self._load_ivf()
+
+    def _load_ivf(self) -> None:
+        if not self.meta.get("ivf_rows") or self.meta["ivf_rows"] > self.rows:
+            self._ivf = None
+        elif (
+            self._ivf is None
+            or self._ivf["rows"] != self.meta["ivf_rows"]
+            or self._ivf["built"] != self.meta.get("ivf_built")
+        ):
+            self._ivf = {
+                name: np.load(self._file(f"ivf_{name}.npy"), mmap_mode="r")
+                for name in ("centroids", "order", "offsets")
+            }
+            self._ivf["rows"] = self.meta["ivf_rows"]
+            self._ivf["built"] = self.meta.get("ivf_built")
+
+    def _index_keys(self, start: int, stop: int) -> None:
+        for row in range(start, stop):
+            self._keys[self._records[row]["key"].decode("utf-8")] = row
+
+    def _row(self, key: str) -> Optional[int]:
+        # The key map is only built on first lookup; searching never needs it
+        if self._keys is None:
+            self._keys = {}
+            self._index_keys(0, self.rows)
+        row = self._keys.get(key)
+        return None if row is None or self._deleted[row] else row
+
+    def __len__(self) -> int:
+        return self.rows - int(np.count_nonzero(self._deleted)) if self.rows else 0
+
+    def __contains__(self, key: str) -> bool:
+        return self._row(key) is not None
+
+    def keys(self) -> List[str]:
+        live = np.flatnonzero(self._deleted == 0) if self.rows else []
+        return [self._records[row]["key"].decode("utf-8") for row in live]
+
+    def tag(self, key: str) -> Optional[str]:
+        row = self._row(key)
+        return None if row is None else self._records[row]["tag"].decode("utf-8")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self._row(key)
+        return None if row is None else np.asarray(self._vectors[row], dtype=np.float32)
+
+    def add(self, keys: List[str], vectors: np.ndarray, tags: Optional[List[str]] = None) -> None:
+        """
+        Append vectors under `keys`, replacing any live rows with the same keys.
+        A key repeated within `keys` keeps its last vector.
+        """
+        if not len(keys):
+            return
+        last = {key: i for i, key in enumerate(keys)}
+        if len(last) < len(keys):
+            keep = sorted(last.values())
+            keys = [keys[i] for i in keep]
+            vectors = np.asarray(vectors)[keep]
+            tags = [tags[i] for i in keep] if tags else tags
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype)
+        records = np.zeros(len(keys), dtype=RECORD)
+        for i, key in enumerate(keys):
+            encoded = key.encode("utf-8")
+            if len(encoded) > RECORD["key"].itemsize:
+                raise ValueError(f"Key too long for the vector store: {key}")
+            records[i] = (encoded, (tags[i] if tags else "").encode("utf-8"))
+
+        with self._locked():
+            self.refresh()
+            if self.dim is None:
+                self.meta["dim"] = int(vectors.shape[1])
+                self._write_meta()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            self._delete_rows([self._row(key) for key in keys])
+            # Append at the mapped length, dropping any torn tail of an earlier append
+            for name, data in (("vectors.bin", vectors), ("keys.bin", records),
+                               ("deleted.bin", np.zeros(len(keys), dtype=np.uint8))):
+                with open(self._file(name), "r+b" if os.path.exists(self._file(name)) else "wb") as f:
+                    f.truncate(self.rows * (data.itemsize * (data.shape[1] if data.ndim > 1 else 1)))
+                    f.seek(0, os.SEEK_END)
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.refresh()
+
+    def _delete_rows(self, rows: List[Optional[int]]) -> None:
+        rows = [row for row in rows if row is not None]
+        if rows:
+            self._deleted[rows] = 1
+            self._deleted.flush()
+
+    def delete(self, keys: List[str]) -> None:
+        """Tombstone the rows of `keys`; they stay on disk until `compact`."""
+        with self._locked():
+            self.refresh()
+            self._delete_rows([self._row(key) for key in keys])
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        The k live rows with the highest dot product with `query`, best first,
+        as (key, score). Approximate when an IVF exists, scanning `nprobe` lists.
+        """
+        if not self.rows or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if self._ivf is not None:
+            candidates = self._ivf_candidates(query, nprobe or IVF_NPROBE)
+            scores = np.asarray(self._vectors[candidates], dtype=np.float32) @ query
+            return self._top(candidates, scores, k)
+
+        best_rows, best_scores = [], []
+        for start in range(0, self.rows, SEARCH_BLOCK_ROWS):
+            block = np.arange(start, min(start + SEARCH_BLOCK_ROWS, self.rows))
+            scores = np.asarray(self._vectors[start:block[-1] + 1], dtype=np.float32) @ query
+            for key, score in self._top(block, scores, k, keyed=False):
+                best_rows.append(key)
+                best_scores.append(score)
+        return self._top(np.array(best_rows, dtype=np.int64), np.array(best_scores, dtype=np.float32), k)
+
+    def _top(self, rows: np.ndarray, scores: np.ndarray, k: int, keyed: bool = True) -> List[Tuple]:
+        live = self._deleted[rows] == 0 if len(rows) else np.zeros(0, dtype=bool)
+        rows, scores = rows[live], scores[live]
+        k = min(k, len(rows))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if not keyed:
+            return [(int(rows[i]), float(scores[i])) for i in top]
+        return [(self._records[rows[i]]["key"].decode("utf-8"), float(scores[i])) for i in top]
+
+    def _ivf_candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        ivf = self._ivf
+        nprobe = min(nprobe, len(ivf["centroids"]))
+        lists = np.argpartition(-(ivf["centroids"] @ query), nprobe - 1)[:nprobe]
+        parts = [ivf["order"][ivf["offsets"][i]:ivf["offsets"][i + 1]] for i in lists]
+        # Rows appended after the IVF was built aren't in any list yet
+        parts.append(np.arange(ivf["rows"], self.rows))
+        return np.concatenate(parts).astype(np.int64)
+
+    def build_ivf(self, nlist: Optional[int] = None, iterations: int = 10, sample: int = 50000, seed: int = 0) -> None:
+        """
+        Partition the live rows into `nlist` lists (about sqrt(rows) by default)
+        with spherical k-means, so searches scan only the lists nearest the query.
+        """
+        with self._locked():
+            self.refresh()
+            live = np.flatnonzero(self._deleted == 0) if self.rows else np.zeros(0, dtype=np.int64)
+            if not len(live):
+                return
+            nlist = max(1, min(nlist or int(np.sqrt(len(live))), len(live)))
+            rng = np.random.default_rng(seed)
+            training = np.asarray(self._vectors[np.sort(rng.choice(live, min(sample, len(live)), replace=False))], dtype=np.float32)
+            # Each list is seeded from a distinct training row
+            nlist = min(nlist, len(training))
+            centroids = training[rng.choice(len(training), nlist, replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(training @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, training)
+                counts = np.bincount(assignment, minlength=nlist)
+                empty = counts == 0
+                # Re-seed empty lists from random training rows
+                sums[empty] = training[rng.choice(len(training), int(empty.sum()))]
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                centroids = (sums / norms).astype(np.float32)
+
+            assignment = np.empty(len(live), dtype=np.int64)
+            for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                rows = live[start:start + SEARCH_BLOCK_ROWS]
+                assignment[start:start + len(rows)] = np.argmax(
+                    np.asarray(self._vectors[rows], dtype=np.float32) @ centroids.T, axis=1
+                )
+            order = np.argsort(assignment, kind="stable")
+            np.save(self._file("ivf_centroids.npy"), centroids)
+            np.save(self._file("ivf_order.npy"), live[order])
+            np.save(self._file("ivf_offsets.npy"), np.searchsorted(assignment[order], np.arange(nlist + 1)))
+            self.meta["ivf_rows"] = self.rows
+            self.meta["ivf_built"] = self.meta.get("ivf_built", 0) + 1
+            self._write_meta()
+            self._ivf = None
+            self._load_ivf()
+
+    def compact(self) -> None:
+        """
+        Rewrite the files without tombstoned rows. Drops the IVF, whose row
+        numbers change; other processes remap on their next `refresh`.
+        """
+        with self._locked():
+            self.refresh()
+            live = np.flatnonzero(self._deleted == 0) if self.rows else np.zeros(0, dtype=np.int64)
+            # New files are swapped in, so existing mappings keep the old ones intact
+            for name, data in (("vectors.bin", self._vectors), ("keys.bin", self._records),
+                               ("deleted.bin", np.zeros(self.rows, dtype=np.uint8))):
+                tmp = self._file(name + ".tmp")
+                with open(tmp, "wb") as f:
+                    for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                        f.write(np.ascontiguousarray(data[live[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+                os.replace(tmp, self._file(name))
+            self.meta["ivf_rows"] = 0
+            self.meta["generation"] = self._generation + 1
+            self._write_meta()
+            self.refresh()
+
+    def clear(self, metadata: Optional[Dict] = None) -> None:
+        """Drop every row, the IVF and the dimension, e.g. after switching embedding models."""
+        with self._locked():
+            self.refresh()
+            for name in ("vectors.bin", "keys.bin", "deleted.bin", "ivf_centroids.npy", "ivf_order.npy", "ivf_offsets.npy"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._generation = self.meta.get("generation", 0) + 1
+            self.meta = {
+                "dim": None,
+                "dtype": self.dtype.name,
+                "ivf_rows": 0,
+                "generation": self._generation,
+                "metadata": metadata or {}
+            }
+            self._write_meta()
+            self.rows = 0
+            self._vectors = np.zeros((0, 0), dtype=self.dtype)
+            self._records = np.zeros(0, dtype=RECORD)
+            self._deleted = np.zeros(0, dtype=np.uint8)
+            self._keys = None
+            self._ivf = None
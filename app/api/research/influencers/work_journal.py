@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+JOURNAL_PATH = os.getenv(
+    "WORK_JOURNAL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "journal.sqlite3")
+)
+LEASE_SECONDS = float(os.getenv("WORK_JOURNAL_LEASE_SECONDS", "600"))
+# Names a worker across restarts (e.g. in containers where pids repeat); its
+# leases are taken back as soon as it starts again
+JOURNAL_OWNER = os.getenv("WORK_JOURNAL_OWNER")
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+class WorkJournal:
+    """
+    Durable per-(stage, item) record of pipeline work in a local SQLite file.
+
+    An item is leased while a worker handles it, marked done together with its
+    result payload, and dropped once that payload reached Supabase; from then
+    on the Supabase rows decide whether it needs work again. After a crash,
+    done-but-unwritten results are replayed instead of being recomputed, and
+    leases of dead processes on this host (or of this `owner`) are released
+    when the journal is opened.
+    """
+
+    def __init__(
+        self,
+        path: str = JOURNAL_PATH,
+        lease_seconds: float = LEASE_SECONDS,
+        owner: Optional[str] = JOURNAL_OWNER
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = owner
+        self.host = socket.gethostname()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS work (
+                    stage TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    payload TEXT,
+                    written INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_host TEXT,
+                    lease_pid INTEGER,
+                    PRIMARY KEY (stage, item_id)
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(work)")}
+            for column, kind in (("lease_owner", "TEXT"), ("lease_host", "TEXT"), ("lease_pid", "INTEGER")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE work ADD COLUMN {column} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS work_unwritten ON work (stage, status, written)")
+            self._conn = conn
+            self._pid = os.getpid()
+            # Journals from before results were dropped on write kept them as done
+            conn.execute("DELETE FROM work WHERE status = ? AND written = 1", (DONE,))
+            self._release_orphaned_leases(conn)
+        return self._conn
+
+    def _release_orphaned_leases(self, conn: sqlite3.Connection) -> None:
+        # Leases of a crashed run would otherwise block its items until they expire
+        holders = conn.execute(
+            "SELECT DISTINCT lease_owner, lease_host, lease_pid FROM work WHERE status = ?", (LEASED,)
+        ).fetchall()
+        orphaned = [
+            (owner, host, pid) for owner, host, pid in holders
+            if host is None
+            or (self.owner is not None and owner == self.owner)
+            or (host == self.host and not _pid_alive(pid))
+        ]
+        conn.executemany(
+            """
+            UPDATE work SET status = ?, lease_until = NULL, updated_at = ?
+            WHERE status = ? AND lease_owner IS ? AND lease_host IS ? AND lease_pid IS ?
+            """,
+            [(PENDING, time.time(), LEASED, owner, host, pid) for owner, host, pid in orphaned]
+        )
+
+    def status(self, stage: str, item_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT status FROM work WHERE stage = ? AND item_id = ?", (stage, item_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, stage: str, item_id: str) -> bool:
+        """True while an item's result is journaled but not yet written to Supabase."""
+        return self.status(stage, item_id) == DONE
+
+    def lease(self, stage: str, item_id: str) -> bool:
+        """
+        Claim an item for this worker. Fails if it is already done or held by a
+        lease that hasn't expired yet.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                """
+                INSERT INTO work (stage, item_id, status, attempts, lease_until, updated_at, lease_owner, lease_host, lease_pid)
+                VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+                ON CONFLICT (stage, item_id) DO UPDATE SET
+                    status = excluded.status,
+                    attempts = work.attempts + 1,
+                    lease_until = excluded.lease_until,
+                    updated_at = excluded.updated_at,
+                    lease_owner = excluded.lease_owner,
+                    lease_host = excluded.lease_host,
+                    lease_pid = excluded.lease_pid
+                WHERE work.status IN (?, ?)
+                   OR (work.status = ? AND work.lease_until < ?)
+                """,
+                (
+                    stage, item_id, LEASED, now + self.lease_seconds, now, self.owner, self.host, os.getpid(),
+                    PENDING, FAILED, LEASED, now
+                )
+            )
+            return cursor.rowcount > 0
+
+    def release(self, stage: str, item_id: str) -> None:
+        """Give up a lease without failing the item, so any worker can take it again."""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE work SET status = ?, lease_until = NULL, updated_at = ? WHERE stage = ? AND item_id = ? AND status = ?",
+                (PENDING, time.time(), stage, item_id, LEASED)
+            )
+
+    def complete(self, stage: str, item_id: str, payload: Any) -> None:
+        """Record the result of an item; it stays unwritten until mark_written."""
+        with self._lock:
+            self._connection().execute(
+                """
+                INSERT INTO work (stage, item_id, status, payload, written, error, updated_at)
+                VALUES (?, ?, ?, ?, 0, NULL, ?)
+                ON CONFLICT (stage, item_id) DO UPDATE SET
+                    status = excluded.status,
+                    payload = excluded.payload,
+                    written = 0,
+                    error = NULL,
+                    lease_until = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                (stage, item_id, DONE, json.dumps(payload), time.time())
+            )
+
+    def mark_written(self, stage: str, item_ids: List[str]) -> None:
+        """Drop results that reached Supabase; whether to redo them is up to the database now."""
+        with self._lock:
+            self._connection().executemany(
+                "DELETE FROM work WHERE stage = ? AND item_id = ? AND status = ?",
+                [(stage, item_id, DONE) for item_id in item_ids]
+            )
+
+    def result(self, stage: str, item_id: str) -> Optional[Any]:
+        """The payload of a completed item, or None."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT payload FROM work WHERE stage = ? AND item_id = ? AND status = ?",
+                (stage, item_id, DONE)
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def forget(self, stage: str, item_ids: List[str]) -> None:
+        """Drop items whose results have been folded into something else."""
+        with self._lock:
+            self._connection().executemany(
+                "DELETE FROM work WHERE stage = ? AND item_id = ?",
+                [(stage, item_id) for item_id in item_ids]
+            )
+
+    def fail(self, stage: str, item_id: str, error: str) -> None:
+        with self._lock:
+            self._connection().execute(
+                "UPDATE work SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE stage = ? AND item_id = ?",
+                (FAILED, error, time.time(), stage, item_id)
+            )
+
+    def unwritten(self, stage: str) -> List[Tuple[str, Any]]:
+        """Completed results of a stage that never made it to Supabase."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT item_id, payload FROM work WHERE stage = ? AND status = ? AND written = 0",
+                (stage, DONE)
+            ).fetchall()
+        return [(item_id, json.loads(payload)) for item_id, payload in rows]
+
+    def summary(self, stage: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT status, COUNT(*) FROM work WHERE stage = ? GROUP BY status", (stage,)
+            ).fetchall()
+        return dict(rows)
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        # Our own pid can only hold leases from an earlier run that reused it
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+_journal: Optional[WorkJournal] = None
+
+def get_work_journal() -> WorkJournal:
+    """Process-wide work journal."""
+    global _journal
+    if _journal is None:
+        _journal = WorkJournal()
+    return _journal
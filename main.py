@@ -1,5 +1,21 @@
+import os
+import sys
+import asyncio
+import argparse
+
+# The pipeline scripts live next to the API route and import each other as siblings
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "api", "research", "influencers"))
+
+
 def main():
-    print("Hello from ai-ugc!")
+    parser = argparse.ArgumentParser(description="Run the influencer pipeline end to end.")
+    parser.add_argument("--ingest", action="store_true", help="insert the seed influencer roster first")
+    parser.add_argument("--skip-catalog", action="store_true", help="don't refresh HeyGen avatars and descriptions")
+    args = parser.parse_args()
+
+    from pipeline import main as run_pipeline
+
+    asyncio.run(run_pipeline(ingest=args.ingest, refresh_catalog=not args.skip_catalog))
 
 
 if __name__ == "__main__":
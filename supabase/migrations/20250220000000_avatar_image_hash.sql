@@ -0,0 +1 @@
+alter table "public"."avatars" add column "image_hash" text;
@@ -0,0 +1,38 @@
+alter table "public"."influencers" add column "tiktok_handle" text;
+
+alter table "public"."influencers" add column "category" text;
+
+update "public"."influencers"
+set "tiktok_handle" = lower(regexp_replace(split_part("tiktok_profile_link", '?', 1), '^.*/@|/+$', '', 'g'))
+where "tiktok_profile_link" like '%/@%';
+
+-- Collapse duplicate handles onto the row with the most work done, oldest first
+create temporary table "influencer_duplicates" as
+select "id", first_value("id") over (
+    partition by "tiktok_handle"
+    order by ("influencer_research" is not null) desc, ("avatar_id" is not null) desc, "created_at", "id"
+) as "keep_id"
+from "public"."influencers"
+where "tiktok_handle" is not null;
+
+-- Repoint everything that references a duplicate before it is deleted;
+-- scripts would otherwise go with it (ON DELETE CASCADE)
+update "public"."research" r
+set "selected_influencer" = d."keep_id"
+from "influencer_duplicates" d
+where r."selected_influencer" = d."id" and d."id" <> d."keep_id";
+
+update "public"."scripts" s
+set "influencer_id" = d."keep_id"
+from "influencer_duplicates" d
+where s."influencer_id" = d."id" and d."id" <> d."keep_id";
+
+delete from "public"."influencers" i
+using "influencer_duplicates" d
+where i."id" = d."id" and d."id" <> d."keep_id";
+
+drop table "influencer_duplicates";
+
+CREATE UNIQUE INDEX influencers_tiktok_handle_key ON public.influencers USING btree (tiktok_handle);
+
+alter table "public"."influencers" add constraint "influencers_tiktok_handle_key" UNIQUE using index "influencers_tiktok_handle_key";
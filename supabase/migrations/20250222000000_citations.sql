@@ -0,0 +1,48 @@
+create table "public"."citations" (
+    "id" uuid not null default gen_random_uuid(),
+    "url" text not null,
+    "url_hash" text not null,
+    "domain" text,
+    "created_at" timestamp with time zone not null default now()
+);
+
+alter table "public"."citations" enable row level security;
+
+create table "public"."influencer_citations" (
+    "influencer_id" uuid not null,
+    "citation_id" uuid not null,
+    "created_at" timestamp with time zone not null default now()
+);
+
+alter table "public"."influencer_citations" enable row level security;
+
+CREATE UNIQUE INDEX citations_pkey ON public.citations USING btree (id);
+
+alter table "public"."citations" add constraint "citations_pkey" PRIMARY KEY using index "citations_pkey";
+
+-- sha256 of the canonical URL, see citation_store.canonicalize_url
+CREATE UNIQUE INDEX citations_url_hash_key ON public.citations USING btree (url_hash);
+
+alter table "public"."citations" add constraint "citations_url_hash_key" UNIQUE using index "citations_url_hash_key";
+
+CREATE UNIQUE INDEX influencer_citations_pkey ON public.influencer_citations USING btree (influencer_id, citation_id);
+
+alter table "public"."influencer_citations" add constraint "influencer_citations_pkey" PRIMARY KEY using index "influencer_citations_pkey";
+
+CREATE INDEX influencer_citations_citation_id_idx ON public.influencer_citations USING btree (citation_id);
+
+alter table "public"."influencer_citations" add constraint "influencer_citations_influencer_id_fkey" FOREIGN KEY (influencer_id) REFERENCES influencers(id) ON DELETE CASCADE;
+
+alter table "public"."influencer_citations" add constraint "influencer_citations_citation_id_fkey" FOREIGN KEY (citation_id) REFERENCES citations(id) ON DELETE CASCADE;
+
+grant all on table "public"."citations" to "anon";
+
+grant all on table "public"."citations" to "authenticated";
+
+grant all on table "public"."citations" to "service_role";
+
+grant all on table "public"."influencer_citations" to "anon";
+
+grant all on table "public"."influencer_citations" to "authenticated";
+
+grant all on table "public"."influencer_citations" to "service_role";
@@ -15,6 +15,7 @@ export type Database = {
           created_at: string
           description: string | null
           gender: string | null
+          image_hash: string | null
           image_url: string | null
           name: string | null
           premium: boolean | null
@@ -24,6 +25,7 @@ export type Database = {
           created_at?: string
           description?: string | null
           gender?: string | null
+          image_hash?: string | null
           image_url?: string | null
           name?: string | null
           premium?: boolean | null
@@ -33,6 +35,7 @@ export type Database = {
           created_at?: string
           description?: string | null
           gender?: string | null
+          image_hash?: string | null
           image_url?: string | null
           name?: string | null
           premium?: boolean | null
@@ -66,9 +69,67 @@ export type Database = {
         }
         Relationships: []
       }
+      citations: {
+        Row: {
+          created_at: string
+          domain: string | null
+          id: string
+          url: string
+          url_hash: string
+        }
+        Insert: {
+          created_at?: string
+          domain?: string | null
+          id?: string
+          url: string
+          url_hash: string
+        }
+        Update: {
+          created_at?: string
+          domain?: string | null
+          id?: string
+          url?: string
+          url_hash?: string
+        }
+        Relationships: []
+      }
+      influencer_citations: {
+        Row: {
+          citation_id: string
+          created_at: string
+          influencer_id: string
+        }
+        Insert: {
+          citation_id: string
+          created_at?: string
+          influencer_id: string
+        }
+        Update: {
+          citation_id?: string
+          created_at?: string
+          influencer_id?: string
+        }
+        Relationships: [
+          {
+            foreignKeyName: "influencer_citations_citation_id_fkey"
+            columns: ["citation_id"]
+            isOneToOne: false
+            referencedRelation: "citations"
+            referencedColumns: ["id"]
+          },
+          {
+            foreignKeyName: "influencer_citations_influencer_id_fkey"
+            columns: ["influencer_id"]
+            isOneToOne: false
+            referencedRelation: "influencers"
+            referencedColumns: ["id"]
+          },
+        ]
+      }
       influencers: {
         Row: {
           avatar_id: string | null
+          category: string | null
           created_at: string
           gender: string | null
           id: string
@@ -76,12 +137,14 @@ export type Database = {
           influencer_research: Json | null
           name: string
           new_avatar_id: string | null
+          tiktok_handle: string | null
           tiktok_profile_link: string | null
           updated_at: string
           voice_id: string | null
         }
         Insert: {
           avatar_id?: string | null
+          category?: string | null
           created_at?: string
           gender?: string | null
           id?: string
@@ -89,12 +152,14 @@ export type Database = {
           influencer_research?: Json | null
           name: string
           new_avatar_id?: string | null
+          tiktok_handle?: string | null
           tiktok_profile_link?: string | null
           updated_at?: string
           voice_id?: string | null
         }
         Update: {
           avatar_id?: string | null
+          category?: string | null
           created_at?: string
           gender?: string | null
           id?: string
@@ -102,6 +167,7 @@ export type Database = {
           influencer_research?: Json | null
           name?: string
           new_avatar_id?: string | null
+          tiktok_handle?: string | null
           tiktok_profile_link?: string | null
           updated_at?: string
           voice_id?: string | null